@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+"""Offline check of ee_client throughput and failure handling against MockBackend.
+
+Compares one blocking request for the whole collection (what the recipes
+used to do: no retries and no splitting) with batched, concurrent requests,
+under the same simulated latency, transient failures and EE size limit.
+"""
+import time
+
+import ee_client
+
+N_FEATURES = 20000
+
+
+def run(label, items, **kwargs):
+    backend = ee_client.MockBackend(failure_rate=0.1, max_batch=2000, seed=1)
+    started = time.time()
+    try:
+        results = ee_client.run_batches(items, backend.fetch, backoff=0.05, **kwargs)
+        complete = [r["properties"]["id"] for r in results] == items
+        error = None
+    except Exception as e:
+        results, complete, error = [], False, e
+    elapsed = time.time() - started
+    print(f"{label}: {len(results)} results in {elapsed:.2f}s, {backend.calls} calls, "
+          f"{backend.failures} simulated failures, complete and in order: {complete}"
+          + (f", failed: {error}" if error else ""))
+    return {"elapsed": elapsed, "complete": complete, "calls": backend.calls}
+
+
+items = list(range(N_FEATURES))
+
+# === One blocking request for the whole collection, no retries or splitting ===
+single = run("single getInfo", items, batch_size=N_FEATURES, workers=1, max_retries=0, split=False)
+
+# === Batched and concurrent with retry, backoff and splitting ===
+batched = run("batched", items, batch_size=500, workers=8)
+
+# === Comparison ===
+if single["complete"]:
+    print(f"Batched took {batched['elapsed'] / single['elapsed']:.2f}x the time of the single request")
+else:
+    print(f"The single request failed after {single['calls']} call(s); "
+          f"the batched run {'completed' if batched['complete'] else 'also failed'} "
+          f"in {batched['elapsed']:.2f}s over {batched['calls']} call(s)")
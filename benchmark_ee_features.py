@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+"""Time the per-row get_ee_feature coordinate loop against ee_client.to_features
+on the res7 grid. Only the client-side payload building is timed, so no Earth
+Engine session is needed."""
+import time
+
+import dataiku
+import numpy as np
+
+import ee_client
+import h3_geometry_cache
+
+GRID = "res7"
+
+
+def iterrows_payload(gdf):
+    """The coordinate handling of the old get_ee_feature loop, without the ee objects"""
+    features = []
+    for _, row in gdf.iterrows():
+        x, y = row.geometry.exterior.coords.xy
+        coords = np.dstack((x, y)).tolist()
+        features.append({"type": "Feature",
+                         "geometry": {"type": "Polygon", "coordinates": coords},
+                         "properties": {"cell_id": row.cell_id}})
+    return features
+
+
+df = dataiku.Dataset(GRID).get_dataframe()
+gdf = h3_geometry_cache.hex_gdf(df)
+
+started = time.time()
+old = iterrows_payload(gdf)
+old_s = time.time() - started
+
+started = time.time()
+new = ee_client.to_features(gdf)
+new_s = time.time() - started
+
+same = all(a["geometry"]["coordinates"] == b["geometry"]["coordinates"] for a, b in zip(old, new))
+print(f"{GRID}: {len(gdf)} hexes, iterrows {old_s:.2f}s, bulk {new_s:.2f}s, "
+      f"speed-up {old_s / new_s:.1f}x, identical coordinates: {same}")
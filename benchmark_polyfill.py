@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+"""Compare the original serial polyfill loop with h3_grid.polyfill on the
+world_boundary and USA_boundary datasets."""
+import time
+
+import dataiku
+import geopandas as gpd
+import h3
+from shapely import wkt
+
+import h3_grid
+
+# === Benchmark cases: (boundary dataset, H3 resolution) ===
+CASES = [
+    ("world_boundary", 3),
+    ("USA_boundary", 5),
+    ("USA_boundary", 7),
+]
+
+
+def serial_polyfill(parts, resolution):
+    """The per-part loop the grid recipes used before h3_grid"""
+    all_cells = set()
+    for poly in parts:
+        try:
+            all_cells.update(h3.geo_to_cells(poly, res=resolution))
+        except Exception as e:
+            print(f"  Failed part: {e}")
+    return all_cells
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+for dataset_name, resolution in CASES:
+    df = dataiku.Dataset(dataset_name).get_dataframe()
+    gdf = gpd.GeoDataFrame(df, geometry=df["geometry"].apply(wkt.loads), crs="EPSG:4326")
+    parts = h3_grid.boundary_parts(gdf)
+
+    serial_cells, serial_s = timed(serial_polyfill, parts, resolution)
+    pool_cells, pool_s = timed(h3_grid.polyfill, parts, resolution)
+
+    print(f"=== {dataset_name} @ res {resolution}: {len(parts)} part(s) ===")
+    print(f"  serial loop : {serial_s:8.2f} s  {len(serial_cells)} cells")
+    print(f"  h3_grid     : {pool_s:8.2f} s  {len(pool_cells)} cells")
+    print(f"  speed-up    : {serial_s / pool_s:8.2f}x")
+    print(f"  identical   : {serial_cells == pool_cells}")
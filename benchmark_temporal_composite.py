@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""Offline check of the RunningComposite statistics against NumPy on synthetic months.
+
+Lognormal radiances with missing months stand in for VIIRS. Mean, max and
+count must match NumPy, and the median must be exact for up to EXACT_STEPS
+months. Past that it must fall within one histogram bin (MEDIAN_BIN_RATIO)
+of the middle values that np.nanmedian averages.
+"""
+import numpy as np
+
+import temporal_composite
+from temporal_composite import MEDIAN_BIN_RATIO, RunningComposite
+
+N_PIXELS = 200000
+MISSING = 0.2   # share of missing pixel-months
+
+
+def months(n_steps, seed=0):
+    rng = np.random.default_rng(seed)
+    stack = rng.lognormal(1, 2, (n_steps, N_PIXELS)).astype(np.float32)
+    stack[rng.random(stack.shape) < MISSING] = np.nan
+    return stack
+
+
+def check(n_steps):
+    stack = months(n_steps)
+    acc = RunningComposite(N_PIXELS, max_steps=n_steps)
+    for month in stack:
+        acc.add(month)
+    result = acc.result()
+
+    n = np.isfinite(stack).sum(axis=0)
+    seen = n > 0
+    assert np.array_equal(result["count"], n)
+    with np.errstate(all="ignore"):
+        assert np.allclose(result["mean"][seen], np.nanmean(stack, axis=0)[seen], rtol=1e-5)
+    assert np.array_equal(result["max"][seen], np.nanmax(stack[:, seen], axis=0))
+    assert np.isnan(result["median"][~seen]).all()
+
+    median = result["median"][seen]
+    exact = np.nanmedian(stack[:, seen], axis=0)
+    rel_err = np.abs(median - exact) / exact
+    if n_steps <= temporal_composite.EXACT_STEPS:
+        assert np.allclose(median, exact, rtol=1e-6), "median of kept values is not exact"
+    else:
+        # Middle pair of each pixel; the histogram median must lie within one bin of it,
+        # where the bins are log-spaced (0.1 to 1000 nW/cm2/sr)
+        ordered = np.sort(stack[:, seen], axis=0)
+        lo = np.take_along_axis(ordered, ((n[seen] - 1) // 2)[None], axis=0)[0]
+        hi = np.take_along_axis(ordered, (n[seen] // 2)[None], axis=0)[0]
+        in_range = (lo >= 0.1) & (hi <= 1000)
+        ok = (median >= lo / MEDIAN_BIN_RATIO) & (median <= hi * MEDIAN_BIN_RATIO)
+        assert ok[in_range].all(), f"{(~ok[in_range]).sum()} median(s) outside one bin of the middle values"
+    print(f"{n_steps} months: mean/max/count exact, median relative error "
+          f"mean {rel_err.mean():.3f}, max {rel_err.max():.3f}")
+
+
+for n_steps in (12, 13, 36):
+    check(n_steps)
@@ -6,9 +6,8 @@
 import dataiku
 import geopandas as gpd
 from shapely import wkt
-import h3
-import matplotlib.pyplot as plt
-import pandas as pd
+
+import h3_grid
 
 # === Read DSS input dataset ===
 USA_boundary = dataiku.Dataset("USA_boundary")
@@ -18,49 +17,13 @@ USA_boundary_df = USA_boundary.get_dataframe()
 # DSS datasets store geometries as WKT strings, so we convert to shapely objects
 gdf = gpd.GeoDataFrame(USA_boundary_df, geometry=USA_boundary_df["geometry"].apply(wkt.loads), crs="EPSG:4326")
 
-# === Combine all geometries if more than one row ===
-geom = gdf.unary_union  # single (Multi)Polygon
-
-# === Decompose MultiPolygon or use Polygon directly ===
-geoms = [geom] if geom.geom_type == "Polygon" else list(geom.geoms)
+# === Combine, decompose and simplify the boundary parts ===
+parts = h3_grid.boundary_parts(gdf)
 
 resolution = 7
-all_cells = set()
-
-print(f"Processing {len(geoms)} geometry part(s) for H3 resolution {resolution}...")
-
-for i, poly in enumerate(geoms):
-    simple_poly = poly.simplify(tolerance=0.01, preserve_topology=True)
-
-    if simple_poly.is_empty or not simple_poly.is_valid:
-        print(f"  Skipping part {i+1}: empty or invalid after simplification.")
-        continue
-
-    try:
-        cells = h3.geo_to_cells(simple_poly, res=resolution)
-        print(f"  Generated {len(cells)} hexes in part {i+1}")
-        all_cells.update(cells)
-    except Exception as e:
-        print(f"  Failed part {i+1}: {e}")
-
-if not all_cells:
-    raise RuntimeError("No hexes generated. Try reducing resolution or adjusting geometry.")
-
-# === Convert H3 cells to geometries ===
-hex_shapes = [h3.cells_to_h3shape([h]) for h in all_cells]
-
-# === Create output GeoDataFrame ===
-df_output = gpd.GeoDataFrame({
-    "cell_id": list(all_cells),
-    "geometry": hex_shapes
-}, crs="EPSG:4326")
-
-# === Convert to Pandas DataFrame for DSS output ===
-# DSS datasets don't support geometry, so convert to WKT
-#df_output["geometry"] = df_output["geometry"].apply(lambda g: g.wkt)
-USA_h3_3_df = pd.DataFrame(df_output)
 
-# === Write to DSS output dataset ===
+# === Stream the polyfill tile by tile straight into the output dataset ===
+# Compact output: integer h3_index only, hexagons are built on demand.
+# Readers use h3_cells.read_grid, or h3_cells.with_wkt for the legacy columns
 # Dataset USA_h3_3 renamed to USA_7 by admin on 2025-08-13 21:45:37
-USA_h3_3 = dataiku.Dataset("USA_7")
-USA_h3_3.write_with_schema(USA_h3_3_df)
\ No newline at end of file
+h3_grid.write_grid_stream("USA_7", h3_grid.iter_polyfill(parts, resolution), compact=True, parts=parts)
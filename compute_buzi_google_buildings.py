@@ -1,9 +1,10 @@
 # -------------------------------------------------------------------------------- NOTEBOOK-CELL: CODE
 # -*- coding: utf-8 -*-
 import dataiku
-import geopandas as gpd
 import ee
-from shapely import wkt
+
+import ee_client
+import h3_geometry_cache
 
 # === Initialize Earth Engine ===
 ee.Initialize(project="diss2-466311")
@@ -12,15 +13,12 @@ ee.Initialize(project="diss2-466311")
 hex_dataset = dataiku.Dataset("moz_h3_4")
 df = hex_dataset.get_dataframe()
 
-# Convert WKT strings to shapely geometries
-gdf = gpd.GeoDataFrame(df, geometry=df["geometry"].apply(wkt.loads), crs="EPSG:4326")
+# Hex geometries from the shared H3 boundary cache
+gdf = h3_geometry_cache.hex_gdf(df)
 
 # === Convert hex to EE FeatureCollection ===
-def get_ee_feature(row):
-    return ee.Feature(ee.Geometry(row.geometry.__geo_interface__), {"cell_id": row.cell_id})
-
-features = [get_ee_feature(row) for _, row in gdf.iterrows()]
-hex_fc = ee.FeatureCollection(features)
+features = ee_client.to_features(gdf)
+hex_fc = ee_client.feature_collection(features)
 
 # === Load Google Open Buildings ===
 moz_geom = gdf.unary_union
@@ -1,42 +1,54 @@
 # -*- coding: utf-8 -*-
 import dataiku
-import geopandas as gpd
 import pandas as pd
-from shapely.geometry import Point
-from shapely import wkt
+
+import h3_cells
+import h3_geometry_cache
+import h3_grid
+from h3_cellset import CellSet
+
+# Also write gdp_density_land, per km² of land, on grids built with land fractions
+LAND_DENSITY = False
 
 # === 1. Load exposure dataset ===
 # Dataset Exposure_res_moz renamed to Exposure_Res_Florida by admin on 2025-07-21 17:35:55
 exposure_ds = dataiku.Dataset("Exposure_Res_Florida")  # <-- Replace with your dataset name
 exposure_df = exposure_ds.get_dataframe()
 
-# === 2. Convert lat/lon to GeoDataFrame ===
-geometry = [Point(xy) for xy in zip(exposure_df["LONGITUDE"], exposure_df["LATITUDE"])]
-gdf_clipped = gpd.GeoDataFrame(exposure_df, geometry=geometry, crs="EPSG:4326")
-
-# === 3. Load H3 hex grid ===
+# === 2. Load H3 hex grid ===
 # Dataset moz_h3_3 renamed to flo_h3_3 by admin on 2025-07-21 17:35:55
 hex_ds = dataiku.Dataset("flo_h3_3")
 hex_df = hex_ds.get_dataframe()
-hexgrid = gpd.GeoDataFrame(
-    hex_df,
-    geometry=hex_df["geometry"].apply(wkt.loads),
-    crs="EPSG:4326"
-)
+hexgrid = h3_geometry_cache.hex_gdf(hex_df)
+
+# === 3. Keep the exposure points that fall in the Florida grid ===
+# Membership is tested against the compacted grid by cell id, replacing the
+# point-in-polygon sjoin against every hexagon
+flo_grid = CellSet.from_grid(hex_df)
+exposure_df = exposure_df.dropna(subset=["LATITUDE", "LONGITUDE"])
+lat, lng = exposure_df["LATITUDE"].to_numpy(), exposure_df["LONGITUDE"].to_numpy()
+inside = flo_grid.contains_points(lat, lng)
+print(f"{inside.sum()} of {len(inside)} exposure points fall in the Florida grid ({flo_grid})")
 
-# === 4. Spatial join: assign points to hex ===
-joined = gpd.sjoin(gdf_clipped, hexgrid, how="inner", predicate="within")
+# === 4. Assign points to hex by integer cell id ===
+joined = exposure_df[inside]
+point_cells = h3_cells.latlng_to_cells(lat[inside], lng[inside], flo_grid.resolution)
 
 # === 5. Aggregate total replacement cost per hex ===
-agg = joined.groupby('cell_id')['TOTAL_REPL_COST_USD'].sum().reset_index()
+agg = joined.groupby(point_cells)["TOTAL_REPL_COST_USD"].sum()
 
 # === 6. Merge totals back into hex grid ===
-hexgrid = hexgrid.merge(agg, on="cell_id", how="left")
-hexgrid["TOTAL_REPL_COST_USD"] = hexgrid["TOTAL_REPL_COST_USD"].fillna(0)
+hexgrid["TOTAL_REPL_COST_USD"] = agg.reindex(h3_cells.to_int_index(hexgrid)).fillna(0).to_numpy()
 
 # === 7. Compute GDP density (USD/km²) ===
 hex_area_km2 = 1054.2  # Approximate area for H3 res 3
 hexgrid["gdp_density"] = hexgrid["TOTAL_REPL_COST_USD"] / hex_area_km2
+# Opt-in: density per km² of land for grids built with land fractions,
+# empty for hexes that are mostly sea or across the border
+if LAND_DENSITY and "land_fraction" in hexgrid.columns:
+    hexgrid["gdp_density_land"] = h3_grid.land_density(
+        hexgrid["TOTAL_REPL_COST_USD"], hex_area_km2, hexgrid["land_fraction"]
+    )
 
 # === 8. Convert geometry to WKT for DSS ===
 hexgrid["geometry"] = hexgrid["geometry"].apply(lambda g: g.wkt)
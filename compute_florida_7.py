@@ -1,13 +1,14 @@
 # -*- coding: utf-8 -*-
 import dataiku
-import pandas as pd
 from shapely import wkt
 from shapely.geometry import shape
 import json
 
+import h3_cells
+
 # Read recipe inputs
-USA_7 = dataiku.Dataset("USA_7")
-USA_7_df = USA_7.get_dataframe()
+# USA_7 is stored in the compact h3_index format; rebuild the WKT hexagons
+USA_7_df = h3_cells.with_wkt(h3_cells.read_grid("USA_7"))
 
 florida_boundary = dataiku.Dataset("florida_boundary")
 florida_boundary_df = florida_boundary.get_dataframe()
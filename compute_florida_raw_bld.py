@@ -1,7 +1,10 @@
 # -*- coding: utf-8 -*-
 import dataiku
+import numpy as np
 import pandas as pd
-import json
+import shapely
+
+import footprints
 
 # Read recipe inputs
 florida_bld = dataiku.Folder("ssDEGfwO")
@@ -14,35 +17,35 @@ if not geojson_paths:
 
 geojson_path = geojson_paths[0]
 
-# Load the GeoJSON and build rows, skipping problematic features
-rows = []
-with florida_bld.get_download_stream(geojson_path) as stream:
-    data = json.load(stream)
-
-features = data.get("features", [])
-for i, feat in enumerate(features):
-    try:
-        props = feat.get("properties", {})
-        geom = feat.get("geometry", None)
 
-        # Basic validation; raise to skip this feature if malformed
-        if not isinstance(props, dict) or geom is None:
-            raise ValueError("Missing properties or geometry")
-
-        row = dict(props)  # flatten properties
+# Build rows batch by batch, skipping problematic features
+def rows(stream):
+    start = 0
+    for properties, wkb in footprints.feature_batches(stream):
+        index = np.arange(start, start + len(properties))
+        start += len(properties)
+        # Skip features without a properties object or a readable geometry
+        geometries = shapely.from_wkb(wkb)
+        keep = np.array([isinstance(p, dict) for p in properties]) & ~shapely.is_missing(geometries)
+        if not keep.any():
+            continue
+        batch = pd.DataFrame([p for p, k in zip(properties, keep) if k])  # flatten properties
         # Store geometry as GeoJSON string (keeps it portable; avoids extra deps)
-        row["_geometry_geojson"] = json.dumps(geom)
-        row["_feature_index"] = i
-        row["_source_path"] = geojson_path
-        rows.append(row)
+        batch["_geometry_geojson"] = shapely.to_geojson(geometries[keep])
+        batch["_feature_index"] = index[keep]
+        batch["_source_path"] = geojson_path
+        yield batch
 
-    except Exception:
-        # Skip any row that causes issues
-        continue
 
-# Create the dataframe (empty if all features failed validation)
-florida_raw_bld_df = pd.DataFrame(rows)
+# Stream the GeoJSON into the output: a first pass collects the property
+# names for the schema, then features are parsed incrementally and each
+# batch is written as soon as it is built, so memory does not grow with
+# the file
+with florida_bld.get_download_stream(geojson_path) as stream:
+    columns = footprints.property_columns(stream)   # every property as text
+columns.update({"_geometry_geojson": str, "_feature_index": "int64", "_source_path": str})
 
-# Write recipe outputs
 florida_raw_bld = dataiku.Dataset("florida_raw_bld")
-florida_raw_bld.write_with_schema(florida_raw_bld_df)
+with florida_bld.get_download_stream(geojson_path) as stream:
+    total = footprints.write_batches(florida_raw_bld, rows(stream), columns)
+print(f"Wrote {total} buildings from {geojson_path}")
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+import os
+
+import footprint_store
+import footprints
+
+# === Footprint sources of each store ===
+# One-time conversion: the building recipes then aggregate the stored cell
+# columns at any resolution in footprint_store.STORE_RESOLUTIONS without
+# reading geometry. The stores in PARTITIONED also get an H3-partitioned copy
+# with geometry, for the regional extracts of the plot recipes
+STORES = {
+    "MOZ": [
+        ("ms", footprints.source_path("ms", "Mozambique")),
+        ("google", footprints.source_path("google", "MOZ")),
+        ("vida", footprints.source_path("vida", "MOZ")),
+    ],
+    "Florida": [
+        ("ms", footprints.source_path("ms", "Florida")),
+    ],
+}
+PARTITIONED = ("MOZ",)
+
+for name, inputs in STORES.items():
+    available = [(source, path) for source, path in inputs if os.path.exists(path)]
+    for source, path in inputs:
+        if (source, path) not in available:
+            print(f"{name}: skipping {source}, no file at {path}")
+    footprint_store.build_store(name, available)
+    if name in PARTITIONED:
+        footprint_store.build_partitions(name, available)
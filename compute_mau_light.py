@@ -12,10 +12,12 @@ ee.Authenticate()
 # -*- coding: utf-8 -*-
 import dataiku
 import geopandas as gpd
-import numpy as np
 import pandas as pd
 import ee
-from shapely import wkt
+
+import ee_client
+import reduction_cache
+import h3_geometry_cache
 
 # === Initialize Earth Engine with project ===
 ee.Initialize(project="diss-463806")
@@ -26,18 +28,11 @@ ee.Initialize(project="diss-463806")
 moz_h3_3 = dataiku.Dataset("mau_h3_3")
 df = moz_h3_3.get_dataframe()
 
-# === Convert geometry column from WKT to shapely ===
-gdf = gpd.GeoDataFrame(df, geometry=df["geometry"].apply(wkt.loads), crs="EPSG:4326")
+# === Hex geometries from the shared H3 boundary cache ===
+gdf = h3_geometry_cache.hex_gdf(df)
 
 # === Convert to Earth Engine FeatureCollection ===
-def get_ee_feature(row):
-    x, y = row.geometry.exterior.coords.xy
-    coords = np.dstack((x, y)).tolist()
-    geom = ee.Geometry.Polygon(coords)
-    return ee.Feature(geom, {"cell_id": row.cell_id})
-
-features = [get_ee_feature(row) for idx, row in gdf.iterrows()]
-hex_fc = ee.FeatureCollection(features)
+features = ee_client.to_features(gdf)
 
 # === Load VIIRS nightlights image and compute mean ===
 # Dataset phi_light renamed to moz_light by admin on 2025-07-17 22:22:52
@@ -48,12 +43,14 @@ nightlights_img = ee.ImageCollection('NOAA/VIIRS/DNB/MONTHLY_V1/VCMSLCFG') \
     .mean()
 
 # === Reduce nightlight mean per hex ===
-zone_stats = nightlights_img.reduceRegions(
-    collection=hex_fc,
+zone_stats = ee_client.reduce_regions(
+    nightlights_img,
+    features,
     reducer=ee.Reducer.mean(),
     scale=500,
-    tileScale=1
-).getInfo()
+    tileScale=1,
+    cache=reduction_cache.reduction_key("NOAA/VIIRS/DNB/MONTHLY_V1/VCMSLCFG", "mean", 500, dates=("2021-01-01", "2021-12-31"), band="avg_rad", composite="mean"),
+)
 
 # === Convert to GeoDataFrame ===
 zone_stats_gdf = gpd.GeoDataFrame.from_features(zone_stats['features'], crs="EPSG:4326")
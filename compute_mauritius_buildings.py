@@ -2,10 +2,11 @@
 # -*- coding: utf-8 -*-
 import dataiku
 import geopandas as gpd
-import numpy as np
 import pandas as pd
 import ee
-from shapely import wkt
+
+import ee_client
+import h3_geometry_cache
 
 ee.Authenticate(auth_mode='notebook')
 
@@ -21,18 +22,11 @@ ee.Initialize(project="diss2-466311")
 usa_h3_3 = dataiku.Dataset("mau_h3_3")
 df = usa_h3_3.get_dataframe()
 
-# === Convert WKT strings to shapely geometries ===
-gdf = gpd.GeoDataFrame(df, geometry=df["geometry"].apply(wkt.loads), crs="EPSG:4326")
+# === Hex geometries from the shared H3 boundary cache ===
+gdf = h3_geometry_cache.hex_gdf(df)
 
 # === Convert GeoDataFrame to Earth Engine FeatureCollection ===
-def get_ee_feature(row):
-    x, y = row.geometry.exterior.coords.xy
-    coords = np.dstack((x, y)).tolist()
-    geom = ee.Geometry.Polygon(coords)
-    return ee.Feature(geom, {"cell_id": row.cell_id})
-
-features = [get_ee_feature(row) for _, row in gdf.iterrows()]
-hex_fc = ee.FeatureCollection(features)
+features = ee_client.to_features(gdf)
 
 # === Load Microsoft Building Footprints for USA ===
 # Dataset: https://planetarycomputer.microsoft.com/dataset/ms-buildings
@@ -47,10 +41,9 @@ def count_buildings_in_hex(hex_feature):
     return hex_feature.set({'building_count': building_count})
 
 # Apply function to each hex
-results_fc = hex_fc.map(count_buildings_in_hex)
+results = ee_client.map_features(features, count_buildings_in_hex)
 
 # === Bring results back to Python ===
-results = results_fc.getInfo()
 results_gdf = gpd.GeoDataFrame.from_features(results['features'], crs="EPSG:4326")
 
 # === Convert geometry to WKT for DSS output ===
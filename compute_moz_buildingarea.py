@@ -1,10 +1,11 @@
 # -*- coding: utf-8 -*-
 import dataiku
 import geopandas as gpd
-import numpy as np
 import pandas as pd
 import ee
-from shapely import wkt
+
+import ee_client
+import h3_geometry_cache
 
 # === Initialize Earth Engine ===
 ee.Initialize(project="diss2-466311")
@@ -13,18 +14,11 @@ ee.Initialize(project="diss2-466311")
 moz_h3_3 = dataiku.Dataset("moz_h3_3")
 df = moz_h3_3.get_dataframe()
 
-# === Convert WKT to shapely geometry
-gdf = gpd.GeoDataFrame(df, geometry=df["geometry"].apply(wkt.loads), crs="EPSG:4326")
+# === Hex geometries from the shared H3 boundary cache
+gdf = h3_geometry_cache.hex_gdf(df)
 
 # === Convert GeoDataFrame to EE FeatureCollection
-def get_ee_feature(row):
-    x, y = row.geometry.exterior.coords.xy
-    coords = np.dstack((x, y)).tolist()
-    geom = ee.Geometry.Polygon(coords)
-    return ee.Feature(geom, {"cell_id": row.cell_id})
-
-features = [get_ee_feature(row) for _, row in gdf.iterrows()]
-hex_fc = ee.FeatureCollection(features)
+features = ee_client.to_features(gdf)
 
 # === Load VIDA building footprints for Mozambique
 buildings_fc = ee.FeatureCollection("projects/sat-io/open-datasets/VIDA_COMBINED/MOZ")
@@ -43,10 +37,9 @@ def summarize_buildings(hex_feature):
     })
 
 # Apply the function
-results_fc = hex_fc.map(summarize_buildings)
+results = ee_client.map_features(features, summarize_buildings)
 
 # === Retrieve results to Python
-results = results_fc.getInfo()
 results_gdf = gpd.GeoDataFrame.from_features(results["features"], crs="EPSG:4326")
 
 # === Convert geometry to WKT
@@ -1,13 +1,8 @@
 # -*- coding: utf-8 -*-
 import dataiku
-import geopandas as gpd
-import numpy as np
-import pandas as pd
-import ee
-from shapely import wkt
 
-# === Initialize Earth Engine ===
-ee.Initialize(project="diss-463806")
+import footprint_store
+import footprints
 
 # === Load DSS input: Mozambique H3 hexes ===
 # Dataset moz_h3_3 renamed to moz_h3_4 by admin on 2025-07-23 23:14:08
@@ -15,45 +10,11 @@ ee.Initialize(project="diss-463806")
 moz_h3_3 = dataiku.Dataset("res7")
 df = moz_h3_3.get_dataframe()
 
-# === Convert WKT to shapely geometry
-gdf = gpd.GeoDataFrame(df, geometry=df["geometry"].apply(wkt.loads), crs="EPSG:4326")
-
-# === Convert GeoDataFrame to EE FeatureCollection
-def get_ee_feature(row):
-    x, y = row.geometry.exterior.coords.xy
-    coords = np.dstack((x, y)).tolist()
-    geom = ee.Geometry.Polygon(coords)
-    return ee.Feature(geom, {"cell_id": row.cell_id})
-
-features = [get_ee_feature(row) for _, row in gdf.iterrows()]
-hex_fc = ee.FeatureCollection(features)
-
-# === Load VIDA building footprints for Mozambique
-buildings_fc = ee.FeatureCollection("projects/sat-io/open-datasets/VIDA_COMBINED/MOZ")
-
-# === Function to count buildings and sum area per hex
-def summarize_buildings(hex_feature):
-    hex_geom = hex_feature.geometry()
-    buildings_in_hex = buildings_fc.filterBounds(hex_geom)
-
-    building_count = buildings_in_hex.size()
-    building_area_sum = buildings_in_hex.aggregate_sum("area_in_meters")  # Assuming "area" is the field in m²
-
-    return hex_feature.set({
-        "building_count": building_count,
-        "building_area_m2": building_area_sum
-    })
-
-# Apply the function
-results_fc = hex_fc.map(summarize_buildings)
-
-# === Retrieve results to Python
-results = results_fc.getInfo()
-results_gdf = gpd.GeoDataFrame.from_features(results["features"], crs="EPSG:4326")
-
-# === Convert geometry to WKT
-results_gdf["geometry"] = results_gdf["geometry"].apply(lambda g: g.wkt)
-moz_buildingarea_df = pd.DataFrame(results_gdf)
+# === Count buildings and sum area per hex
+# VIDA combined footprints for Mozambique from the columnar footprint store,
+# each footprint in the cell holding its centroid, with its area_in_meters
+building_stats = footprint_store.cell_stats("MOZ", footprints.grid_resolution(df), sources=("vida",))
+moz_buildingarea_df = footprints.building_frame(df, building_stats)
 
 # === Write to DSS output dataset
 # Dataset moz_buildingarea renamed to moz_buildingareas by admin on 2025-07-18 12:06:36
@@ -61,5 +22,3 @@ moz_buildingarea_df = pd.DataFrame(results_gdf)
 # Dataset moz_buildingareas_1 renamed to moz_buildingareas_3 by admin on 2025-08-10 11:42:46
 moz_buildingarea = dataiku.Dataset("moz_buildingareas_3")
 moz_buildingarea.write_with_schema(moz_buildingarea_df)
-
-
@@ -1,10 +1,12 @@
 # -*- coding: utf-8 -*-
 import dataiku
 import geopandas as gpd
-import numpy as np
 import pandas as pd
 import ee
-from shapely import wkt
+
+import ee_client
+import reduction_cache
+import h3_geometry_cache
 
 # === Initialize Earth Engine ===
 ee.Initialize(project="diss-463806")
@@ -15,32 +17,26 @@ ee.Initialize(project="diss-463806")
 moz_h3_3 = dataiku.Dataset("res7")
 df = moz_h3_3.get_dataframe()
 
-# === Convert WKT strings to shapely geometries ===
-gdf = gpd.GeoDataFrame(df, geometry=df["geometry"].apply(wkt.loads), crs="EPSG:4326")
+# === Hex geometries from the shared H3 boundary cache ===
+gdf = h3_geometry_cache.hex_gdf(df)
 
 # === Convert GeoDataFrame to Earth Engine FeatureCollection ===
-def get_ee_feature(row):
-    x, y = row.geometry.exterior.coords.xy
-    coords = np.dstack((x, y)).tolist()
-    geom = ee.Geometry.Polygon(coords)
-    return ee.Feature(geom, {"cell_id": row.cell_id})
-
-features = [get_ee_feature(row) for _, row in gdf.iterrows()]
-hex_fc = ee.FeatureCollection(features)
+features = ee_client.to_features(gdf)
 
 # === Load JRC GHSL building height image for 2018 ===
 height_img = ee.Image("JRC/GHSL/P2023A/GHS_BUILT_H/2018").select("built_height")
 
 # === Compute average height per hex ===
-results_fc = height_img.reduceRegions(
-    collection=hex_fc,
+results = ee_client.reduce_regions(
+    height_img,
+    features,
     reducer=ee.Reducer.mean(),
     scale=100,        # GHS dataset has 100m resolution
-    tileScale=1
+    tileScale=1,
+    cache=reduction_cache.reduction_key("JRC/GHSL/P2023A/GHS_BUILT_H/2018", "mean", 100, band="built_height"),
 )
 
 # === Retrieve results from EE to Python ===
-results = results_fc.getInfo()
 results_gdf = gpd.GeoDataFrame.from_features(results['features'], crs="EPSG:4326")
 
 # === Rename column for clarity ===
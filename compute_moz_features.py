@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+import dataiku
+
+import hex_features
+
+# === Hex grids and the feature table each one produces ===
+# One pass per grid replaces the separate moz_pop*, moz_light*, moz_ghsl*,
+# moz_buildingheights* and moz_ghsl_landuse* recipes and the joins between them
+outputs = {
+    "moz_h3_3": "moz_features",
+    "moz_h3_4": "moz_features_1",
+    "moz_h3_6": "moz_features_2",
+    "res7": "moz_features_3",
+}
+
+for grid_name, dataset_name in outputs.items():
+    # === Load DSS hex input ===
+    df = dataiku.Dataset(grid_name).get_dataframe()
+
+    # === Population, night lights, GHSL built surface, height and land use in one tiled pass ===
+    features_df = hex_features.extract_features(df, hex_features.FEATURE_LAYERS)
+
+    # === Write the combined feature table ===
+    print(f"Writing {len(features_df)} cells to {dataset_name}")
+    dataiku.Dataset(dataset_name).write_with_schema(features_df)
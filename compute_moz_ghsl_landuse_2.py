@@ -1,24 +1,8 @@
-# -------------------------------------------------------------------------------- NOTEBOOK-CELL: CODE
-import geopandas as gpd
-from io import StringIO
-import ee
-import pandas as pd
-import dataiku
-ee.Authenticate()
-
-# -------------------------------------------------------------------------------- NOTEBOOK-CELL: CODE
-
-# Initialize Earth Engine (do this once per session)
 # -*- coding: utf-8 -*-
 import dataiku
-import geopandas as gpd
-import numpy as np
-import pandas as pd
-import ee
-from shapely import wkt
 
-# === Initialize Earth Engine with project ===
-ee.Initialize(project="diss-463806")
+import h3_cells
+import zonal_stats
 
 # === Load DSS hex input ===
 # Dataset phi_h3_3 renamed to moz_h3_3 by admin on 2025-07-17 22:22:52
@@ -26,57 +10,23 @@ ee.Initialize(project="diss-463806")
 moz_h3_3 = dataiku.Dataset("moz_h3_6")
 df = moz_h3_3.get_dataframe()
 
-# === Convert geometry column from WKT to shapely ===
-gdf = gpd.GeoDataFrame(df, geometry=df["geometry"].apply(wkt.loads), crs="EPSG:4326")
-
-# === Convert to Earth Engine FeatureCollection ===
-def get_ee_feature(row):
-    x, y = row.geometry.exterior.coords.xy
-    coords = np.dstack((x, y)).tolist()
-    geom = ee.Geometry.Polygon(coords)
-    return ee.Feature(geom, {"cell_id": row.cell_id})
-
-features = [get_ee_feature(row) for idx, row in gdf.iterrows()]
-hex_fc = ee.FeatureCollection(features)
-
-# === Load VIIRS nightlights image and compute mean ===
+# === Reduce GHSL built-up classification (2018) per hex ===
 # Dataset phi_light renamed to moz_light by admin on 2025-07-17 22:22:52
 # Dataset moz_light renamed to moz_ghsl by admin on 2025-07-23 22:48:36
-# === Load GHSL Built-up Surface image for 2025 ===
 # Dataset moz_ghsl renamed to moz_ghsl_landuse by admin on 2025-07-23 22:55:56
-# === Load GHSL Built-up Classification image for 2018 ===
-ghsl_lu_img = ee.Image('JRC/GHSL/P2023A/GHS_BUILT_C/2018')
-
-# === Reduce majority class per hex (i.e., most common class) ===
-# === Reduce histogram of land use classes (more reliable than mode) ===
-landuse_stats = ghsl_lu_img.reduceRegions(
-    collection=hex_fc,
-    reducer=ee.Reducer.frequencyHistogram(),
-    scale=100,
-    tileScale=4
-).getInfo()
-
-# === Convert result to GeoDataFrame ===
-landuse_stats_gdf = gpd.GeoDataFrame.from_features(landuse_stats['features'], crs="EPSG:4326")
-
-# === Extract most frequent class, ignoring 0 ===
-def get_top_class_excluding_zero(hist):
-    if not isinstance(hist, dict):
-        return None
-    parsed = {int(k): v for k, v in hist.items()}
-    non_zero = {k: v for k, v in parsed.items() if k != 0}
-    return max(non_zero, key=non_zero.get) if non_zero else None
-
-# Apply it
-landuse_stats_gdf["landuse_class"] = landuse_stats_gdf["histogram"].apply(get_top_class_excluding_zero)
-
-
-
-
-#df_output["geometry"] = df_output["geometry"].apply(lambda g: g.wkt)
-moz_h3_3_df = pd.DataFrame(landuse_stats_gdf)
+# Local copy of JRC/GHSL/P2023A/GHS_BUILT_C/2018, 100 m pixels. Class counts
+# come from one 2-D bincount, with the majority class ignoring 0 (unbuilt)
+landuse_stats = zonal_stats.categorical_stats(
+    zonal_stats.GHSL_BUILT_C_2018, h3_cells.to_int_index(df), zonal_stats.GHSL_BUILT_C_CLASSES
+)
+
+# === Class pixel counts, class shares and majority class as dense columns ===
+class_columns = [c for c in landuse_stats.columns if c.startswith(("hist_", "share_"))]
+columns = dict(zip(class_columns, class_columns))
+columns["majority_class"] = "landuse_class"
+moz_h3_3_df = zonal_stats.zonal_frame(df, landuse_stats, columns)
 
 # === Write to DSS output dataset ===
 # Dataset moz_ghsl_landuse renamed to moz_ghsl_landuse_2 by admin on 2025-08-10 10:30:08
 phi_h3_3 = dataiku.Dataset("moz_ghsl_landuse_2")
-phi_h3_3.write_with_schema(moz_h3_3_df)
\ No newline at end of file
+phi_h3_3.write_with_schema(moz_h3_3_df)
@@ -1,44 +1,48 @@
 # -*- coding: utf-8 -*-
 import dataiku
-import geopandas as gpd
-import pandas as pd
-from shapely.geometry import Point
-from shapely import wkt
+
+import h3_cells
+import h3_grid
+
+# Also write gdp_density_land, per km² of land, on grids built with land fractions
+LAND_DENSITY = False
 
 # === 1. Load exposure dataset ===
 exposure_ds = dataiku.Dataset("Exposure_res_moz")  # <-- Replace with your dataset name
 exposure_df = exposure_ds.get_dataframe()
 
-# === 2. Convert lat/lon to GeoDataFrame ===
-geometry = [Point(xy) for xy in zip(exposure_df["LONGITUDE"], exposure_df["LATITUDE"])]
-gdf_clipped = gpd.GeoDataFrame(exposure_df, geometry=geometry, crs="EPSG:4326")
-
-# === 3. Load H3 hex grid ===
-hex_ds = dataiku.Dataset("moz_h3_3")
-hex_df = hex_ds.get_dataframe()
-hexgrid = gpd.GeoDataFrame(
-    hex_df,
-    geometry=hex_df["geometry"].apply(wkt.loads),
-    crs="EPSG:4326"
+# === 2. Load H3 hex grid as integer cell ids (no WKT parsing) ===
+hexgrid = h3_cells.read_grid("moz_h3_3")
+resolution = int(h3_cells.get_resolution(hexgrid["h3_index"].iloc[:1])[0])
+
+# === 3. Assign points to hex by integer cell id ===
+exposure_df = exposure_df.dropna(subset=["LATITUDE", "LONGITUDE"])
+exposure_df["h3_index"] = h3_cells.latlng_to_cells(
+    exposure_df["LATITUDE"].to_numpy(), exposure_df["LONGITUDE"].to_numpy(), resolution
 )
 
-# === 4. Spatial join: assign points to hex ===
-joined = gpd.sjoin(gdf_clipped, hexgrid, how="inner", predicate="within")
+# === 4. Keep only points that fall in the grid ===
+joined = exposure_df[exposure_df["h3_index"].isin(hexgrid["h3_index"])]
 
 # === 5. Aggregate total replacement cost per hex ===
-agg = joined.groupby('cell_id')['TOTAL_REPL_COST_USD'].sum().reset_index()
+agg = joined.groupby("h3_index")["TOTAL_REPL_COST_USD"].sum().reset_index()
 
 # === 6. Merge totals back into hex grid ===
-hexgrid = hexgrid.merge(agg, on="cell_id", how="left")
+hexgrid = hexgrid.merge(agg, on="h3_index", how="left")
 hexgrid["TOTAL_REPL_COST_USD"] = hexgrid["TOTAL_REPL_COST_USD"].fillna(0)
 
 # === 7. Compute GDP density (USD/km²) ===
 hex_area_km2 = 1054.2  # Approximate area for H3 res 3
 hexgrid["gdp_density"] = hexgrid["TOTAL_REPL_COST_USD"] / hex_area_km2
-
-# === 8. Convert geometry to WKT for DSS ===
-hexgrid["geometry"] = hexgrid["geometry"].apply(lambda g: g.wkt)
-output_df = pd.DataFrame(hexgrid)
+# Opt-in: density per km² of land for grids built with land fractions,
+# empty for hexes that are mostly sea or across the border
+if LAND_DENSITY and "land_fraction" in hexgrid.columns:
+    hexgrid["gdp_density_land"] = h3_grid.land_density(
+        hexgrid["TOTAL_REPL_COST_USD"], hex_area_km2, hexgrid["land_fraction"]
+    )
+
+# === 8. Rebuild cell_id and WKT geometry for DSS ===
+output_df = h3_cells.with_wkt(hexgrid)
 
 # === 9. Write to DSS output dataset ===
 output = dataiku.Dataset("moz_totalrep")  # <-- Replace with your output dataset name
@@ -3,7 +3,12 @@ import dataiku
 import geopandas as gpd
 import pandas as pd
 from shapely.geometry import Point
-from shapely import wkt
+
+import h3_geometry_cache
+import h3_grid
+
+# Also write gdp_density_land, per km² of land, on grids built with land fractions
+LAND_DENSITY = False
 
 # === 1. Load exposure dataset ===
 exposure_ds = dataiku.Dataset("Exposure_res_moz")  # <-- Replace with your dataset name
@@ -18,11 +23,7 @@ gdf_clipped = gpd.GeoDataFrame(exposure_df, geometry=geometry, crs="EPSG:4326")
 # Dataset moz_h3_4 renamed to res7 by admin on 2025-08-10 11:48:00
 hex_ds = dataiku.Dataset("res7")
 hex_df = hex_ds.get_dataframe()
-hexgrid = gpd.GeoDataFrame(
-    hex_df,
-    geometry=hex_df["geometry"].apply(wkt.loads),
-    crs="EPSG:4326"
-)
+hexgrid = h3_geometry_cache.hex_gdf(hex_df)
 
 # === 4. Spatial join: assign points to hex ===
 joined = gpd.sjoin(gdf_clipped, hexgrid, how="inner", predicate="within")
@@ -37,6 +38,12 @@ hexgrid["TOTAL_REPL_COST_USD"] = hexgrid["TOTAL_REPL_COST_USD"].fillna(0)
 # === 7. Compute GDP density (USD/km²) ===
 hex_area_km2 = 1054.2  # Approximate area for H3 res 3
 hexgrid["gdp_density"] = hexgrid["TOTAL_REPL_COST_USD"] / hex_area_km2
+# Opt-in: density per km² of land for grids built with land fractions,
+# empty for hexes that are mostly sea or across the border
+if LAND_DENSITY and "land_fraction" in hexgrid.columns:
+    hexgrid["gdp_density_land"] = h3_grid.land_density(
+        hexgrid["TOTAL_REPL_COST_USD"], hex_area_km2, hexgrid["land_fraction"]
+    )
 
 # === 8. Convert geometry to WKT for DSS ===
 hexgrid["geometry"] = hexgrid["geometry"].apply(lambda g: g.wkt)
@@ -1,48 +1,28 @@
 # -------------------------------------------------------------------------------- NOTEBOOK-CELL: CODE
 # -*- coding: utf-8 -*-
+import os
+
 import dataiku
 import geopandas as gpd
-import ee
 from shapely import wkt
 
-# === Initialize Earth Engine ===
-ee.Initialize(project="diss2-466311")
+import footprint_store
+import footprints
 
 # === Load DSS input: Mozambique hexes ===
 hex_dataset = dataiku.Dataset("moz_h3_3")
 df = hex_dataset.get_dataframe()
 
-# Convert WKT strings to shapely geometries
-gdf = gpd.GeoDataFrame(df, geometry=df["geometry"].apply(wkt.loads), crs="EPSG:4326")
-
-# === Convert hex to EE FeatureCollection ===
-def get_ee_feature(row):
-    return ee.Feature(ee.Geometry(row.geometry.__geo_interface__), {"cell_id": row.cell_id})
-
-features = [get_ee_feature(row) for _, row in gdf.iterrows()]
-hex_fc = ee.FeatureCollection(features)
-
-# === Load Google Open Buildings ===
-moz_geom = gdf.unary_union
-moz_ee_geom = ee.Geometry(moz_geom.__geo_interface__)
-buildings_fc = ee.FeatureCollection("GOOGLE/Research/open-buildings/v3/polygons").filterBounds(moz_ee_geom)
-
-# === Count buildings per hex ===
-def count_buildings_in_hex(hex_feature):
-    count = buildings_fc.filterBounds(hex_feature.geometry()).size()
-    return hex_feature.set({'building_count': count})
-
-results_fc = hex_fc.map(count_buildings_in_hex)
-
-# === Export as a table to Google Cloud Storage ===
-task = ee.batch.Export.table.toDrive(
-    collection=results_fc,
-    description='moz_building_count_export',
-    folder="EarthEngine_Exports",  # Your Google Drive folder
-    fileNamePrefix='moz_building_count',
-    fileFormat='GeoJSON'
-)
-
-# Start the export task
-task.start()
-print("🚀 Export task started on GEE. Check task status in the Earth Engine Task Manager.")
+# === Count Google Open Buildings per hex ===
+# Open Buildings v3 footprints from the columnar footprint store, each in the
+# cell holding its centroid, instead of one filterBounds query per hex on
+# Earth Engine
+building_stats = footprint_store.cell_stats("MOZ", footprints.grid_resolution(df), sources=("google",))
+results_df = footprints.building_frame(df, building_stats)
+
+# === Export as a GeoJSON table, as the Earth Engine export did ===
+export_dir = os.path.join(footprints.FOOTPRINT_DIR, "exports")
+os.makedirs(export_dir, exist_ok=True)
+results_gdf = gpd.GeoDataFrame(results_df, geometry=results_df["geometry"].apply(wkt.loads), crs="EPSG:4326")
+results_gdf.to_file(os.path.join(export_dir, "moz_building_count.geojson"), driver="GeoJSON")
+print(f"Exported {len(results_gdf)} hexes to {export_dir}")
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+import dataiku
+import geopandas as gpd
+from shapely import wkt
+
+import h3_grid
+
+# === Read DSS input dataset ===
+moz_boundary = dataiku.Dataset("mozambique_boundary")
+moz_boundary_df = moz_boundary.get_dataframe()
+
+# === Convert WKT to geometry (if needed) ===
+# DSS datasets store geometries as WKT strings, so we convert to shapely objects
+gdf = gpd.GeoDataFrame(moz_boundary_df, geometry=moz_boundary_df["geometry"].apply(wkt.loads), crs="EPSG:4326")
+
+# === Combine, decompose and simplify the boundary parts ===
+parts = h3_grid.boundary_parts(gdf)
+
+# === Output datasets and their H3 resolutions ===
+# Replaces the separate moz_h3_3, moz_h3_6 and mozambique_7 recipes, which each
+# polyfilled mozambique_boundary again. Adding a resolution here costs one groupby.
+outputs = {
+    "moz_h3_3": 3,
+    "moz_h3_6": 3,
+    "mozambique_7": 7,
+}
+
+# "centroid" matches a direct polyfill at each resolution; use "any" or a
+# share such as 0.25 to keep partially covered parents
+coverage_mode = "centroid"
+
+# === Polyfill once at the finest resolution, derive the coarser grids ===
+grids = h3_grid.build_grids(parts, outputs.values(), coverage=coverage_mode, cache_name="mozambique_boundary")
+
+# === Write every resolution to its DSS output dataset ===
+for dataset_name, resolution in outputs.items():
+    coverage = grids[resolution]
+    out_df = h3_grid.cells_to_frame(coverage.index, coverage=coverage, parts=parts)
+    print(f"Writing {len(out_df)} res-{resolution} cells to {dataset_name}")
+    dataiku.Dataset(dataset_name).write_with_schema(out_df)
@@ -10,10 +10,12 @@ ee.Authenticate()
 # -*- coding: utf-8 -*-
 import dataiku
 import geopandas as gpd
-import numpy as np
 import pandas as pd
 import ee
-from shapely import wkt
+
+import ee_client
+import reduction_cache
+import h3_geometry_cache
 
 # === Initialize Earth Engine ===
 ee.Initialize(project="diss-463806")
@@ -22,18 +24,11 @@ ee.Initialize(project="diss-463806")
 phi_h3_3 = dataiku.Dataset("phi_h3_3")
 df = phi_h3_3.get_dataframe()
 
-# === Convert WKT strings to shapely geometries ===
-gdf = gpd.GeoDataFrame(df, geometry=df["geometry"].apply(wkt.loads), crs="EPSG:4326")
+# === Hex geometries from the shared H3 boundary cache ===
+gdf = h3_geometry_cache.hex_gdf(df)
 
 # === Convert GeoDataFrame to Earth Engine FeatureCollection ===
-def get_ee_feature(row):
-    x, y = row.geometry.exterior.coords.xy
-    coords = np.dstack((x, y)).tolist()
-    geom = ee.Geometry.Polygon(coords)
-    return ee.Feature(geom, {"cell_id": row.cell_id})
-
-features = [get_ee_feature(row) for _, row in gdf.iterrows()]
-hex_fc = ee.FeatureCollection(features)
+features = ee_client.to_features(gdf)
 
 # === Load WorldPop 2020 population count image ===
 pop_img = ee.ImageCollection("CIESIN/GPWv411/GPW_Population_Count") \
@@ -41,12 +36,14 @@ pop_img = ee.ImageCollection("CIESIN/GPWv411/GPW_Population_Count") \
     .mean()
 
 # === Reduce to total population per hex ===
-zone_stats = pop_img.reduceRegions(
-    collection=hex_fc,
+zone_stats = ee_client.reduce_regions(
+    pop_img,
+    features,
     reducer=ee.Reducer.sum(),
     scale=1000,       # WorldPop resolution ~1km
-    tileScale=1
-).getInfo()
+    tileScale=1,
+    cache=reduction_cache.reduction_key("CIESIN/GPWv411/GPW_Population_Count", "sum", 1000, dates=("2020-01-01", "2020-12-31"), composite="mean"),
+)
 
 # === Convert results to GeoDataFrame ===
 zone_stats_gdf = gpd.GeoDataFrame.from_features(zone_stats["features"], crs="EPSG:4326")
@@ -4,9 +4,7 @@ import dataiku
 import pandas as pd
 import numpy as np
 
-# Geospatial
-import geopandas as gpd
-from shapely import wkt
+import h3_cells
 
 # =============================
 # Helpers
@@ -66,42 +64,27 @@ r5_id_col = pick_first(r5_df, ["h3_r5", "r5_id", "h3_index", "h3", "cell_id"], w
 r7_pred_col = guess_pred_col(r7_df)   # fine model outputs (scores or values)
 r5_pred_col = guess_pred_col(r5_df)   # coarse model totals (values)
 
-# Geometry columns (WKT assumed)
-r7_geom_col = pick_first(r7_df, ["geometry", "wkt", "geom"], what="r7 geometry")
-r5_geom_col = pick_first(r5_df, ["geometry", "wkt", "geom"], what="r5 geometry")
-
 # Optional area weight at fine level
 if "area_weight" not in r7_df.columns:
     r7_df["area_weight"] = 1.0
 
 # =============================
-# Convert to GeoDataFrames
+# Integer cell ids (no WKT parsing)
 # =============================
-r7_gdf = gpd.GeoDataFrame(
-    r7_df.copy(),
-    geometry=r7_df[r7_geom_col].apply(wkt.loads),
-    crs="EPSG:4326"
-)
-r5_gdf = gpd.GeoDataFrame(
-    r5_df.copy(),
-    geometry=r5_df[r5_geom_col].apply(wkt.loads),
-    crs="EPSG:4326"
-)
-
-# Keep only what we need on r5 side for join: parent id + geometry
-r5_gdf_for_join = r5_gdf[[r5_id_col, "geometry"]].rename(columns={r5_id_col: "r5_id"})
+r7_df["r7_int"] = h3_cells.as_int_ids(r7_df[r7_id_col])
+r5_df["r5_int"] = h3_cells.as_int_ids(r5_df[r5_id_col])
+r5_res = int(h3_cells.get_resolution(r5_df["r5_int"].iloc[:1])[0])
 
 # =============================
-# Spatial join r7 -> r5 (parent linkage)
+# Parent linkage r7 -> r5 from the H3 hierarchy
 # =============================
-# Prefer modern GeoPandas API: predicate="within". If your environment is older, switch to op="within".
-try:
-    joined = gpd.sjoin(r7_gdf, r5_gdf_for_join, how="left", predicate="within")
-except TypeError:
-    # Fallback for older geopandas versions
-    joined = gpd.sjoin(r7_gdf, r5_gdf_for_join, how="left", op="within")
+# Replaces the r7-within-r5 polygon sjoin: the parent id is a bit operation
+# on the integer cell id, and the join is an integer merge
+joined = r7_df.copy()
+joined["r5_int"] = h3_cells.cell_to_parent(joined["r7_int"].to_numpy(), r5_res)
+joined = joined.merge(r5_df[["r5_int", r5_id_col]].rename(columns={r5_id_col: "r5_id"}), on="r5_int", how="left")
 
-# joined now contains an 'r5_id' column for each r7 polygon (where match was found)
+# joined now contains an 'r5_id' column for each r7 cell (where a parent was found)
 missing_parent = joined["r5_id"].isna().sum()
 if missing_parent > 0:
     # Drop or handle as needed; we drop them to maintain mass conservation
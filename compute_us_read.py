@@ -1,43 +1,32 @@
 # -*- coding: utf-8 -*-
 import dataiku
 import pandas as pd
-import json
-import io
-from shapely.geometry import shape
-from shapely.wkt import dumps as wkt_dumps
+import shapely
+
+import footprints
 
 # --- Path to your Florida file in the managed folder ---
 FL_FILE = "Florida.geojson"
 
-# Read the raw JSON from folder
-us = dataiku.Folder("PU90ow7l")
-with us.get_download_stream(FL_FILE) as stream:
-    text = io.TextIOWrapper(stream, encoding="utf-8", errors="replace").read()
-geojson = json.loads(text)
 
-# Normalize into a list of features
-if geojson.get("type") == "FeatureCollection":
-    features = geojson.get("features", [])
-elif geojson.get("type") == "Feature":
-    features = [geojson]
-else:
-    raise ValueError(f"Unexpected GeoJSON type: {geojson.get('type')}")
+# Build rows batch by batch: properties + geometry WKT
+def rows(stream):
+    for properties, wkb in footprints.feature_batches(stream):
+        batch = pd.DataFrame([p or {} for p in properties])
+        batch["geometry_wkt"] = shapely.to_wkt(shapely.from_wkb(wkb), rounding_precision=-1)
+        yield batch
 
-# Build rows: properties + geometry WKT
-rows = []
-for feat in features:
-    props = (feat.get("properties") or {}).copy()
-    geom = feat.get("geometry")
-    if geom:
-        try:
-            props["geometry_wkt"] = wkt_dumps(shape(geom))
-        except Exception:
-            props["geometry_wkt"] = None
-    rows.append(props)
 
-# Make DataFrame
-us_read_df = pd.DataFrame(rows)
+# --- Stream the file from the folder into the output dataset ---
+# A first pass collects the property names for the schema, then features
+# are parsed incrementally and written batch by batch, so the whole state
+# file is never held in memory
+us = dataiku.Folder("PU90ow7l")
+with us.get_download_stream(FL_FILE) as stream:
+    columns = footprints.property_columns(stream)   # every property as text
+columns["geometry_wkt"] = str
 
-# --- Write to output dataset ---
 us_read = dataiku.Dataset("us_read")
-us_read.write_with_schema(us_read_df)
+with us.get_download_stream(FL_FILE) as stream:
+    total = footprints.write_batches(us_read, rows(stream), columns)
+print(f"Wrote {total} buildings from {FL_FILE}")
@@ -1,15 +1,12 @@
 # -*- coding: utf-8 -*-
+import os
+
 import dataiku
-import geopandas as gpd
-import numpy as np
-import pandas as pd
-import ee
-from shapely import wkt
 
-# === Initialize Earth Engine ===
-ee.Initialize(project="diss-463806")
+import footprints
+import h3_cells
 
-# === List of all 51 U.S. states and DC (matching EE asset folder names) ===
+# === List of all 51 U.S. states and DC (matching the footprint file names) ===
 states = [
     "Alabama", "Alaska", "Arizona", "Arkansas", "California", "Colorado",
     "Connecticut", "Delaware", "District_of_Columbia", "Florida", "Georgia",
@@ -25,56 +22,27 @@ states = [
 # === Load DSS input: USA hexes ===
 usa_h3_3 = dataiku.Dataset("USA_h3_3")
 df = usa_h3_3.get_dataframe()
+cells = h3_cells.to_int_index(df)
 
-# Convert WKT strings to shapely geometries
-gdf = gpd.GeoDataFrame(df, geometry=df["geometry"].apply(wkt.loads), crs="EPSG:4326")
-
-# Convert GeoDataFrame to Earth Engine FeatureCollection
-def get_ee_feature(row):
-    x, y = row.geometry.exterior.coords.xy
-    coords = np.dstack((x, y)).tolist()
-    geom = ee.Geometry.Polygon(coords)
-    return ee.Feature(geom, {"cell_id": row.cell_id})
-
-features = [get_ee_feature(row) for _, row in gdf.iterrows()]
-hex_fc = ee.FeatureCollection(features)
-
-# === Collect results from all states ===
-all_results = []
-
+# === Microsoft Building Footprints, one state file per worker process ===
+state_paths = {}
 for state in states:
-    try:
-        print(f"Processing {state}...")
-
-        # Load building footprints for the current state
-        buildings_fc = ee.FeatureCollection(f'projects/sat-io/open-datasets/MSBuildings/US/{state}')
-
-        # Define reducer function for this state
-        def count_buildings_in_hex(hex_feature):
-            hex_geom = hex_feature.geometry()
-            buildings_in_hex = buildings_fc.filterBounds(hex_geom)
-            building_count = buildings_in_hex.size()
-            return hex_feature.set({'building_count': building_count, 'state': state})
-
-        # Apply the function to each hex
-        state_results_fc = hex_fc.map(count_buildings_in_hex)
-
-        # Get results from Earth Engine
-        state_results = state_results_fc.getInfo()
-        state_gdf = gpd.GeoDataFrame.from_features(state_results['features'], crs="EPSG:4326")
-        all_results.append(state_gdf)
-
-    except Exception as e:
-        print(f"Error processing {state}: {e}")
-
-# === Combine all state results ===
-if all_results:
-    final_gdf = pd.concat(all_results, ignore_index=True)
-    final_gdf["geometry"] = final_gdf["geometry"].apply(lambda g: g.wkt)
-else:
-    final_gdf = pd.DataFrame(columns=["cell_id", "building_count", "state", "geometry"])
+    path = footprints.source_path("ms", state)
+    if os.path.exists(path):
+        state_paths[state] = path
+    else:
+        print(f"Error processing {state}: no footprint file at {path}")
+
+# Each worker streams one state and counts buildings only in the hexes its
+# footprints fall in, instead of mapping a filterBounds count over every USA hex.
+# Only counts are output, so no footprint area is computed
+state_stats = footprints.aggregate_files(state_paths, footprints.grid_resolution(df), cells=cells, with_area=False)
+
+# === Merge-reduce: hexes straddling state lines sum their per-state counts ===
+# state is the state holding most of the hex's buildings
+usa_stats = footprints.merge_labelled(state_stats, "state")
+final_df = footprints.building_frame(df, usa_stats, columns=("building_count", "state"))
 
 # === Write to DSS dataset ===
 usa_buildings = dataiku.Dataset("usa_buildings")
-usa_buildings.write_with_schema(final_gdf)
-
+usa_buildings.write_with_schema(final_df)
@@ -1,8 +1,9 @@
 # -*- coding: utf-8 -*-
 import dataiku
 import pandas as pd, numpy as np
-import geopandas as gpd
-from shapely import wkt
+import shapely
+
+import h3_cells
 
 # === Load datasets ===
 # Building footprints (us_read) -> contains geometry of buildings
@@ -10,41 +11,28 @@ from shapely import wkt
 us_read = dataiku.Dataset("al_read")
 us_read_df = us_read.get_dataframe()
 
-# Hex grid (res 7 hexes)
-USA_7 = dataiku.Dataset("USA_7")
-USA_7_df = USA_7.get_dataframe()
-
-# === Convert to GeoDataFrames ===
-# Building footprints
-buildings_gdf = gpd.GeoDataFrame(
-    us_read_df,
-    geometry=gpd.GeoSeries.from_wkt(us_read_df["geometry"]),
-    crs="EPSG:4326"
-)
-
-# Hexes
-hexes_gdf = gpd.GeoDataFrame(
-    USA_7_df,
-    geometry=gpd.GeoSeries.from_wkt(USA_7_df["geometry"]),
-    crs="EPSG:4326"
-)
-
-# === Spatial join: count buildings per hex ===
-# Ensure buildings fall inside hexes
-join = gpd.sjoin(buildings_gdf, hexes_gdf, how="left", predicate="within")
+# Hex grid (res 7 hexes, compact h3_index format)
+USA_7_df = h3_cells.read_grid("USA_7")
+resolution = int(h3_cells.get_resolution(USA_7_df["h3_index"].iloc[:1])[0])
+
+# === Assign each building to the hex holding its centroid ===
+# Integer cell ids replace the polygon sjoin, so no hex WKT is parsed here
+buildings = shapely.from_wkt(us_read_df["geometry"].to_numpy())
+buildings = buildings[~(shapely.is_missing(buildings) | shapely.is_empty(buildings))]
+centroids = shapely.centroid(buildings)
+building_cells = h3_cells.latlng_to_cells(shapely.get_y(centroids), shapely.get_x(centroids), resolution)
 
 # Count buildings per hex_id
-bld_counts = join.groupby("cell_id").size().reset_index(name="bld_count")
+bld_counts = pd.DataFrame({"h3_index": building_cells}).groupby("h3_index").size().reset_index(name="bld_count")
 
-# Merge counts back to hex polygons
-hex_with_counts = hexes_gdf.merge(bld_counts, on="cell_id", how="left")
+# Merge counts back to the hex grid
+hex_with_counts = USA_7_df.merge(bld_counts, on="h3_index", how="left")
 
 # Replace NaN counts with 0 (hexes that had no buildings)
 hex_with_counts["bld_count"] = hex_with_counts["bld_count"].fillna(0).astype(int)
 
-# === Drop building-level geometry, keep only hex geometry ===
-usa_plot_df = pd.DataFrame(hex_with_counts.drop(columns=["geometry"]))
-usa_plot_df["geometry"] = hex_with_counts["geometry"].apply(lambda g: g.wkt)
+# === Rebuild hex geometry as WKT for the plot output ===
+usa_plot_df = h3_cells.with_wkt(hex_with_counts)
 
 # === Write recipe outputs ===
 usa_plot = dataiku.Dataset("usa_plot")
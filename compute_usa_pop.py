@@ -1,22 +1,8 @@
-# -------------------------------------------------------------------------------- NOTEBOOK-CELL: CODE
-import geopandas as gpd
-from io import StringIO
-import ee
-import pandas as pd
-import dataiku
-ee.Authenticate()
-
-# -------------------------------------------------------------------------------- NOTEBOOK-CELL: CODE
 # -*- coding: utf-8 -*-
 import dataiku
-import geopandas as gpd
-import numpy as np
-import pandas as pd
-import ee
-from shapely import wkt
 
-# === Initialize Earth Engine ===
-ee.Initialize(project="diss-463806")
+import h3_cells
+import zonal_stats
 
 # === Load DSS input: hexes ===
 # Dataset phi_h3_3 renamed to moz_h3_3 by admin on 2025-07-18 10:57:18
@@ -24,42 +10,16 @@ ee.Initialize(project="diss-463806")
 usa_h3_3 = dataiku.Dataset("USA_h3_3")
 df = usa_h3_3.get_dataframe()
 
-# === Convert WKT strings to shapely geometries ===
-gdf = gpd.GeoDataFrame(df, geometry=df["geometry"].apply(wkt.loads), crs="EPSG:4326")
-
-# === Convert GeoDataFrame to Earth Engine FeatureCollection ===
-def get_ee_feature(row):
-    x, y = row.geometry.exterior.coords.xy
-    coords = np.dstack((x, y)).tolist()
-    geom = ee.Geometry.Polygon(coords)
-    return ee.Feature(geom, {"cell_id": row.cell_id})
-
-features = [get_ee_feature(row) for _, row in gdf.iterrows()]
-hex_fc = ee.FeatureCollection(features)
-
-# === Load WorldPop 2020 population count image ===
+# === Reduce GPWv4.11 2020 population count to total population per hex ===
 # Dataset phi_pop renamed to moz_pop by admin on 2025-07-18 10:57:18
 # Dataset moz_pop renamed to usa_pop by admin on 2025-07-18 10:58:33
-pop_img = ee.ImageCollection("CIESIN/GPWv411/GPW_Population_Count") \
-    .filterDate("2020-01-01", "2020-12-31") \
-    .mean()
-
-# === Reduce to total population per hex ===
-zone_stats = pop_img.reduceRegions(
-    collection=hex_fc,
-    reducer=ee.Reducer.sum(),
-    scale=1000,       # WorldPop resolution ~1km
-    tileScale=1
-).getInfo()
-
-# === Convert results to GeoDataFrame ===
-zone_stats_gdf = gpd.GeoDataFrame.from_features(zone_stats["features"], crs="EPSG:4326")
-zone_stats_gdf = zone_stats_gdf.rename(columns={"sum": "total_population"})
+# Windowed mode reads the raster one parent-cell tile at a time, so memory
+# stays flat over the whole USA; ZONAL_MAX_TILES caps the tiles in flight
+zone_stats = zonal_stats.windowed_zonal_stats(zonal_stats.GPW_POPULATION_2020, h3_cells.to_int_index(df))
 
-# === Convert geometry back to WKT for DSS output ===
-zone_stats_gdf["geometry"] = zone_stats_gdf["geometry"].apply(lambda g: g.wkt)
-usa_pop_df = pd.DataFrame(zone_stats_gdf)
+# === Same columns as the reduceRegions output: geometry WKT, cell_id, total_population ===
+usa_pop_df = zonal_stats.zonal_frame(df, zone_stats, {"sum": "total_population"})
 
 # === Write result to DSS dataset ===
 usa_pop = dataiku.Dataset("usa_pop")
-usa_pop.write_with_schema(usa_pop_df)
\ No newline at end of file
+usa_pop.write_with_schema(usa_pop_df)
@@ -0,0 +1,16 @@
+# -*- coding: utf-8 -*-
+import os
+
+import temporal_composite
+import zonal_stats
+
+# === Years of the night-light panel ===
+# Each year's monthly VIIRS avg_rad rasters are folded one month at a time, so
+# adding years to the panel adds reads, not memory
+YEARS = [2021]
+
+for year in YEARS:
+    monthly = temporal_composite.viirs_monthly(year)
+    print(f"{year}: {len(monthly)} monthly raster(s) in {temporal_composite.VIIRS_MONTHLY_DIR}")
+    out_path = os.path.join(zonal_stats.RASTER_DIR, f"viirs_vcmslcfg_avg_rad_{year}.tif")
+    temporal_composite.composite(monthly, out_path, stats=temporal_composite.STATS)
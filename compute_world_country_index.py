@@ -0,0 +1,15 @@
+# -*- coding: utf-8 -*-
+import country_index
+
+# === Build the per-country H3 land-mask index from the world shapefile ===
+# Run once (or after the shapefile changes). Country grid recipes then look their
+# cells up with country_index.country_cells instead of polyfilling a boundary.
+summary = country_index.build_index(
+    shapefile_path=country_index.WORLD_SHAPEFILE,
+    resolutions=country_index.INDEX_RESOLUTIONS,
+)
+
+# === Report index size ===
+for country, counts in sorted(summary.items()):
+    print(country, counts)
+print(f"Indexed {len(summary)} countries into {country_index.INDEX_DIR}")
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""Precomputed per-country H3 land masks built once from the world shapefile.
+
+For every country with primary land in the world boundary shapefile the
+index stores its cell set at each resolution in INDEX_RESOLUTIONS, in
+compacted H3 form (one .npz per country). A country grid is then a lookup
+plus an uncompact, or a CellSet for membership tests, instead of a
+shapefile read and a polyfill.
+"""
+import json
+import os
+
+import geopandas as gpd
+import numpy as np
+
+import h3_cells
+import h3_grid
+from h3_cellset import CellSet
+
+WORLD_SHAPEFILE = "/home/hid24/dss_data/managed_folders/DISSERTATION/wHowFVsB"
+INDEX_DIR = os.environ.get(
+    "H3_COUNTRY_INDEX", "/home/hid24/dss_data/managed_folders/DISSERTATION/h3_country_index"
+)
+INDEX_RESOLUTIONS = (3, 4, 5, 6, 7)
+LAND_TYPE = "Primary land"
+
+
+def _country_path(country):
+    return os.path.join(INDEX_DIR, country.replace(" ", "_").replace("/", "_") + ".npz")
+
+
+def build_index(shapefile_path=WORLD_SHAPEFILE, resolutions=INDEX_RESOLUTIONS, countries=None):
+    """Polyfill every country once at the finest resolution and store compacted cell sets"""
+    world = gpd.read_file(shapefile_path).to_crs(epsg=4326)
+    world = world[world["LAND_TYPE"] == LAND_TYPE]
+    if countries is not None:
+        world = world[world["COUNTRY"].isin(countries)]
+    os.makedirs(INDEX_DIR, exist_ok=True)
+
+    summary = {}
+    for country, country_gdf in world.groupby("COUNTRY"):
+        print(f"Indexing {country}...")
+        parts = h3_grid.boundary_parts(country_gdf)
+        if not parts:
+            continue
+        try:
+            grids = h3_grid.build_grids(parts, resolutions)
+        except RuntimeError as e:
+            # Small islands can have no cell centre inside them at coarse resolutions
+            print(f"  Skipping {country}: {e}")
+            continue
+
+        arrays = {
+            f"res_{res}": CellSet.from_cells(coverage.index, res).compact
+            for res, coverage in grids.items()
+        }
+        np.savez(_country_path(country), **arrays)
+        summary[country] = {str(res): len(coverage) for res, coverage in grids.items()}
+
+    with open(os.path.join(INDEX_DIR, "countries.json"), "w") as f:
+        json.dump(summary, f, indent=2, sort_keys=True)
+    return summary
+
+
+def countries():
+    """Countries in the index with their cell count per resolution"""
+    with open(os.path.join(INDEX_DIR, "countries.json")) as f:
+        return json.load(f)
+
+
+def country_cellset(country, resolution):
+    """The country's grid at one resolution as a compacted CellSet, without expanding it"""
+    path = _country_path(country)
+    if not os.path.exists(path):
+        raise KeyError(f"{country} is not in the country index at {INDEX_DIR}; run compute_world_country_index first.")
+    with np.load(path) as index:
+        key = f"res_{resolution}"
+        if key not in index:
+            raise KeyError(f"Resolution {resolution} is not indexed for {country}.")
+        return CellSet(index[key], resolution)
+
+
+def country_cells(country, resolution):
+    """The country's cell set at one resolution, uncompacted from the index"""
+    return set(h3_cells.int_to_str(country_cellset(country, resolution).cells()))
@@ -0,0 +1,319 @@
+# -*- coding: utf-8 -*-
+"""Columnar store of building footprints for geometry-free hex aggregation.
+
+The building recipes only use each footprint's location, area and source,
+yet every run re-read and re-parsed full polygon geometry. build_store
+converts the footprint sources of a region once into memory-mapped NumPy
+columns. Hex aggregation at any resolution in STORE_RESOLUTIONS then
+becomes a bincount over one precomputed cell column, with no geometry read.
+
+Each store lives in STORE_DIR/<name>/ as:
+
+- lng.npy, lat.npy: float32 centroid coordinates
+- area_m2.npy: float32 footprint area (the source's area attribute, else
+  the geodesic area on the WGS84 ellipsoid)
+- source.npy: uint8 source id (SOURCE_IDS)
+- cells_<res>.npy: uint64 H3 cell of the centroid at each resolution
+- meta.json: footprint count, sources and resolutions
+
+For regional extracts that need the polygons themselves, build_partitions
+writes a second layout under PARTITION_DIR/<name>/. Footprints are grouped
+by the res-PARTITION_RES H3 cell of their centroid, one directory per
+cell, each holding WKB geometry (wkb.npy bytes plus wkb_offsets.npy) and
+the source's feature properties as JSON (properties.npy plus
+properties_offsets.npy) next to the lng, lat, area_m2 and source columns. extract() opens only the
+partitions whose hexagon meets a boundary. Partitions inside the boundary
+are taken whole, and only edge partitions are clipped geometry by geometry.
+"""
+import json
+import os
+import shutil
+import uuid
+
+import numpy as np
+import pandas as pd
+import shapely
+
+import footprints
+import h3_cells
+import h3_geometry_cache
+
+STORE_DIR = os.environ.get(
+    "FOOTPRINT_STORE", "/home/hid24/dss_data/managed_folders/DISSERTATION/footprint_store"
+)
+STORE_RESOLUTIONS = (3, 4, 5, 6, 7, 8, 9)
+SOURCE_IDS = {"ms": 1, "google": 2, "vida": 3}
+CHUNK = 5000000     # store rows reduced at a time by cell_stats
+PARTITION_DIR = os.path.join(STORE_DIR, "partitioned")
+PARTITION_RES = 3
+EDGE_BUFFER_DEG = 0.001     # ~100 m; catches footprints just across a partition edge
+
+
+def _columns(resolutions):
+    return ["lng", "lat", "area_m2", "source"] + [f"cells_{res}" for res in resolutions]
+
+
+def build_store(name, inputs, resolutions=STORE_RESOLUTIONS):
+    """Convert footprint files into a columnar store.
+
+    inputs is a list of (source, path) pairs, source being a key of
+    footprints.SOURCES. Files are streamed batch by batch, each batch is
+    written as a chunk of every column, and the chunks are joined into
+    memory-mapped columns at the end, so memory stays flat.
+    """
+    resolutions = sorted(resolutions)
+    os.makedirs(STORE_DIR, exist_ok=True)
+    tmp = os.path.join(STORE_DIR, f".tmp_{uuid.uuid4().hex}")
+    os.makedirs(tmp)
+
+    chunks = []
+    for source, path in inputs:
+        area_property = footprints.SOURCES[source]["area"]
+        print(f"Converting {source} footprints from {path}...")
+        batches = footprints.read_batches(path, area_property, area_fn=footprints.geodesic_area_m2)
+        for lng, lat, areas in batches:
+            chunk = {
+                "lng": np.asarray(lng, dtype=np.float32),
+                "lat": np.asarray(lat, dtype=np.float32),
+                "area_m2": np.nan_to_num(np.asarray(areas, dtype=np.float32)),
+                "source": np.full(len(lng), SOURCE_IDS[source], dtype=np.uint8),
+            }
+            # Each resolution is indexed from the centroid itself: H3 children do not nest
+            # exactly, so the parent of a fine cell can differ from the coarse cell of the point
+            for res in resolutions:
+                chunk[f"cells_{res}"] = h3_cells.latlng_to_cells(lat, lng, res)
+            chunk_no = len(chunks)
+            for column, values in chunk.items():
+                np.save(os.path.join(tmp, f"{column}.{chunk_no}.npy"), values)
+            chunks.append(len(lng))
+
+    # === Join the chunks into one memory-mapped file per column ===
+    n = int(sum(chunks))
+    for column in _columns(resolutions):
+        first = np.load(os.path.join(tmp, f"{column}.0.npy"), mmap_mode="r") if chunks else np.zeros(0)
+        out = np.lib.format.open_memmap(os.path.join(tmp, f"{column}.npy"), mode="w+", dtype=first.dtype, shape=(n,))
+        start = 0
+        for chunk_no, size in enumerate(chunks):
+            part_path = os.path.join(tmp, f"{column}.{chunk_no}.npy")
+            out[start:start + size] = np.load(part_path)
+            os.remove(part_path)
+            start += size
+        out.flush()
+        del first, out
+
+    with open(os.path.join(tmp, "meta.json"), "w") as f:
+        json.dump({"count": n, "sources": sorted({s for s, _ in inputs}), "resolutions": resolutions}, f, indent=2)
+
+    path = os.path.join(STORE_DIR, name)
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    os.replace(tmp, path)
+    print(f"Stored {n} footprints as {path}")
+    return n
+
+
+class FootprintStore:
+    """Memory-mapped columns of one footprint store"""
+
+    def __init__(self, name):
+        self.path = os.path.join(STORE_DIR, name)
+        with open(os.path.join(self.path, "meta.json")) as f:
+            self.meta = json.load(f)
+
+    def __len__(self):
+        return self.meta["count"]
+
+    def column(self, name):
+        return np.load(os.path.join(self.path, f"{name}.npy"), mmap_mode="r")
+
+    def cells(self, resolution):
+        if resolution not in self.meta["resolutions"]:
+            raise ValueError(f"Store has resolutions {self.meta['resolutions']}, not {resolution}")
+        return self.column(f"cells_{resolution}")
+
+
+def cell_stats(name, resolution, sources=None):
+    """Building count and total area per cell from a store, shaped like footprints.cell_stats.
+
+    sources restricts the footprints to some of footprints.SOURCES, and
+    raises when the store was built without one of them. The store is
+    reduced CHUNK rows at a time with np.unique and np.bincount.
+    """
+    store = FootprintStore(name)
+    missing = sorted(set(sources or ()) - set(store.meta["sources"]))
+    if missing:
+        raise ValueError(f"Footprint store {name} has no {', '.join(missing)} footprints; "
+                         f"add the file(s) and rerun compute_footprint_store")
+    cells, areas = store.cells(resolution), store.column("area_m2")
+    source = store.column("source") if sources is not None else None
+    source_ids = [SOURCE_IDS[s] for s in sources] if sources is not None else None
+
+    partials = []
+    for start in range(0, len(store), CHUNK):
+        chunk_cells = np.asarray(cells[start:start + CHUNK])
+        chunk_areas = np.asarray(areas[start:start + CHUNK], dtype=float)
+        if source is not None:
+            keep = np.isin(source[start:start + CHUNK], source_ids)
+            chunk_cells, chunk_areas = chunk_cells[keep], chunk_areas[keep]
+        partials.append(footprints.grouped_stats(chunk_cells, chunk_areas))
+    stats = footprints.merge_stats(partials)
+    print(f"Aggregated {len(store)} stored footprints of {name} into {len(stats)} res-{resolution} cells")
+    return stats
+
+
+# === H3-partitioned footprints with geometry ===
+
+def _partition_key(cell):
+    return format(int(cell), "x")
+
+
+def _blob(values):
+    """Concatenated bytes of values and the length of each"""
+    lengths = np.fromiter((len(b) for b in values), dtype=np.int64, count=len(values))
+    return np.frombuffer(b"".join(values), dtype=np.uint8), lengths
+
+
+def _save_part(part_dir, chunk_no, geometries, properties, lng, lat, areas, source_id):
+    wkb, lengths = _blob(shapely.to_wkb(geometries))
+    records = [json.dumps(r, default=str).encode() for r in properties.to_dict("records")]
+    if not len(properties.columns):
+        records = [b"{}"] * len(geometries)
+    properties, property_lengths = _blob(records)
+    np.savez(
+        os.path.join(part_dir, f"chunk_{chunk_no}.npz"),
+        wkb=wkb,
+        lengths=lengths,
+        properties=properties,
+        property_lengths=property_lengths,
+        lng=lng.astype(np.float32),
+        lat=lat.astype(np.float32),
+        area_m2=np.nan_to_num(np.asarray(areas, dtype=np.float32)),
+        source=np.full(len(geometries), source_id, dtype=np.uint8),
+    )
+
+
+def _join_part(part_dir):
+    """Join a partition's chunk files into its columns"""
+    chunk_paths = sorted(
+        (p for p in os.listdir(part_dir) if p.startswith("chunk_")),
+        key=lambda p: int(p[len("chunk_"):-len(".npz")]),
+    )
+    chunks = [dict(np.load(os.path.join(part_dir, p))) for p in chunk_paths]
+    for column in ("lng", "lat", "area_m2", "source", "wkb", "properties"):
+        np.save(os.path.join(part_dir, f"{column}.npy"), np.concatenate([c[column] for c in chunks]))
+    for blob, lengths in (("wkb", "lengths"), ("properties", "property_lengths")):
+        lengths = np.concatenate([c[lengths] for c in chunks])
+        np.save(os.path.join(part_dir, f"{blob}_offsets.npy"), np.concatenate([[0], np.cumsum(lengths)]))
+    for p in chunk_paths:
+        os.remove(os.path.join(part_dir, p))
+    return len(lengths)
+
+
+def build_partitions(name, inputs, partition_res=PARTITION_RES):
+    """Write footprint files as partitions keyed by the res-partition_res cell of each centroid.
+
+    inputs is a list of (source, path) pairs as for build_store. Batches
+    are split by partition and appended as chunk files, which are joined
+    per partition at the end. Every feature property of the source files
+    is kept, except the geometry.
+    """
+    os.makedirs(PARTITION_DIR, exist_ok=True)
+    tmp = os.path.join(PARTITION_DIR, f".tmp_{uuid.uuid4().hex}")
+    os.makedirs(tmp)
+
+    chunk_no, source_counts = 0, {}
+    for source, path in inputs:
+        area_property = footprints.SOURCES[source]["area"]
+        print(f"Partitioning {source} footprints from {path} at res {partition_res}...")
+        for geometries, properties in footprints.feature_frames(path):
+            keep = ~shapely.is_missing(geometries) & ~shapely.is_empty(geometries)
+            geometries, properties = geometries[keep], properties[keep].reset_index(drop=True)
+            if area_property is None:
+                areas = footprints.geodesic_area_m2(geometries)
+            else:
+                areas = pd.to_numeric(properties[area_property]).to_numpy(dtype=float)
+            source_counts[source] = source_counts.get(source, 0) + len(geometries)
+            centroids = shapely.centroid(geometries)
+            lng, lat = shapely.get_x(centroids), shapely.get_y(centroids)
+            parts = h3_cells.latlng_to_cells(lat, lng, partition_res)
+            unique, inverse = np.unique(parts, return_inverse=True)
+            for i, part in enumerate(unique):
+                rows = inverse == i
+                part_dir = os.path.join(tmp, _partition_key(part))
+                os.makedirs(part_dir, exist_ok=True)
+                _save_part(part_dir, chunk_no, geometries[rows], properties[rows], lng[rows], lat[rows],
+                           areas[rows], SOURCE_IDS[source])
+            chunk_no += 1
+
+    counts = {key: _join_part(os.path.join(tmp, key)) for key in sorted(os.listdir(tmp))}
+    with open(os.path.join(tmp, "index.json"), "w") as f:
+        json.dump({"resolution": partition_res, "sources": source_counts, "partitions": counts}, f, indent=2)
+
+    path = os.path.join(PARTITION_DIR, name)
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    os.replace(tmp, path)
+    print(f"Stored {sum(counts.values())} footprints in {len(counts)} res-{partition_res} partition(s) as {path}")
+    return counts
+
+
+def _blob_values(part_dir, blob, rows):
+    values = np.load(os.path.join(part_dir, f"{blob}.npy"), mmap_mode="r")
+    offsets = np.load(os.path.join(part_dir, f"{blob}_offsets.npy"))
+    return [bytes(values[offsets[i]:offsets[i + 1]]) for i in rows]
+
+
+def _read_part(part_dir, sources=None, boundary=None):
+    """Frame of one partition's footprints, clipped to boundary when given"""
+    columns = {c: np.load(os.path.join(part_dir, f"{c}.npy")) for c in ("lng", "lat", "area_m2", "source")}
+    rows = np.arange(len(columns["source"]))
+    if sources is not None:
+        rows = rows[np.isin(columns["source"], [SOURCE_IDS[s] for s in sources])]
+    geometries = shapely.from_wkb(_blob_values(part_dir, "wkb", rows)) if len(rows) else np.array([], dtype=object)
+    if boundary is not None and len(rows):
+        hit = shapely.intersects(boundary, geometries)
+        rows, geometries = rows[hit], geometries[hit]
+    out = pd.DataFrame({c: values[rows] for c, values in columns.items()})
+    out["geometry"] = geometries
+    out["properties"] = [json.loads(b) for b in _blob_values(part_dir, "properties", rows)]
+    return out
+
+
+def extract(name, boundary, sources=None):
+    """Footprints of a partitioned store that intersect a lng/lat boundary.
+
+    Only partitions whose hexagon (grown by EDGE_BUFFER_DEG) meets the
+    boundary are opened. Partitions whose hexagon lies inside the boundary
+    are kept whole and edge partitions are clipped with an exact
+    intersects test, like filterBounds. Returns a frame with shapely
+    geometry, area_m2, source name, centroid lng/lat and a dict of the
+    source's feature properties. Raises when the store holds no
+    footprints of a requested source, e.g. its file was missing at build.
+    """
+    path = os.path.join(PARTITION_DIR, name)
+    with open(os.path.join(path, "index.json")) as f:
+        index = json.load(f)
+    for source in sources or ():
+        if not index["sources"].get(source):
+            raise ValueError(f"Footprint store {name} has no {source} footprints; "
+                             f"add the {source} file and rerun compute_footprint_store")
+    keys = sorted(index["partitions"])
+    cells = np.array([int(k, 16) for k in keys], dtype=np.uint64)
+    hexes = shapely.buffer(h3_geometry_cache.polygons(cells), EDGE_BUFFER_DEG)
+    shapely.prepare(boundary)
+    touching = shapely.intersects(boundary, hexes)
+    inside = touching & shapely.contains(boundary, hexes)
+    print(f"Extracting from {int(touching.sum())} of {len(keys)} partition(s), "
+          f"{int(touching.sum() - inside.sum())} of them on the boundary edge")
+
+    parts = [
+        _read_part(os.path.join(path, key), sources, None if is_inside else boundary)
+        for key, is_inside in zip(np.array(keys)[touching], inside[touching])
+    ]
+    if not parts:
+        return pd.DataFrame(columns=["lng", "lat", "area_m2", "source", "geometry", "properties"])
+
+    out = pd.concat(parts, ignore_index=True)
+    source_names = {v: k for k, v in SOURCE_IDS.items()}
+    out["source"] = out["source"].map(source_names)
+    return out
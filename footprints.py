@@ -0,0 +1,486 @@
+# -*- coding: utf-8 -*-
+"""Local building-footprint counts and areas per H3 cell.
+
+The building recipes ran buildings_fc.filterBounds(hex) on Earth Engine for
+every hex, which is one spatial query per cell. Here a footprint file is
+streamed once in batches instead. Each batch gets its centroids and their
+H3 cells in bulk and is reduced to a count and total area per cell with
+np.bincount, so the cost grows with the number of footprints only. Every
+footprint is counted once, in the cell holding its centroid, where
+filterBounds counted a footprint in every hex it touched.
+
+Downloads of the three footprint sources live under FOOTPRINT_DIR:
+
+- ms: Microsoft Building Footprints, line-delimited GeoJSON per region,
+  without an area attribute (area is computed on an equal-area projection)
+- google: Google Open Buildings v3 CSV, with centroid latitude/longitude
+  and area_in_meters columns, so no geometry is parsed
+- vida: VIDA combined Google/Microsoft footprints, GeoParquet per country
+  with area_in_meters
+
+Whole-file GeoJSON downloads (e.g. a US state) are parsed incrementally by
+iter_features and feature_batches, which never hold more than one batch.
+"""
+import gzip
+import io
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice, repeat
+
+import numpy as np
+import pandas as pd
+import shapely
+from pyproj import Geod, Transformer
+
+import h3_cells
+import h3_geometry_cache
+
+FOOTPRINT_DIR = os.environ.get(
+    "FOOTPRINT_DIR", "/home/hid24/dss_data/managed_folders/DISSERTATION/building_footprints"
+)
+BATCH_SIZE = 200000     # footprints per batch
+READ_CHUNK = 1 << 20    # characters read from a GeoJSON stream at a time
+MERGE_EVERY = 50        # batches between merges of the partial per-cell totals
+
+SOURCES = {
+    "ms": {"path": "ms_buildings/{region}.geojsonl.gz", "area": None},
+    "google": {"path": "google_open_buildings/{region}.csv.gz", "area": "area_in_meters"},
+    "vida": {"path": "vida_combined/{region}.parquet", "area": "area_in_meters"},
+}
+
+# World cylindrical equal-area, for the area of footprints without an area attribute
+_EQUAL_AREA = Transformer.from_crs("EPSG:4326", "EPSG:6933", always_xy=True)
+_GEOD = Geod(ellps="WGS84")
+
+
+def source_path(source, region):
+    """Local file of a footprint source for a region, e.g. ("vida", "MOZ")"""
+    return os.path.join(FOOTPRINT_DIR, SOURCES[source]["path"].format(region=region))
+
+
+def equal_area_m2(geometries):
+    """Area in m2 of lng/lat geometries, measured on an equal-area projection"""
+    projected = shapely.transform(
+        geometries, lambda xy: np.column_stack(_EQUAL_AREA.transform(xy[:, 0], xy[:, 1]))
+    )
+    return shapely.area(projected)
+
+
+def geodesic_area_m2(geometries):
+    """Geodesic area in m2 of lng/lat geometries on the WGS84 ellipsoid (one pyproj call per geometry)"""
+    return np.array([abs(_GEOD.geometry_area_perimeter(g)[0]) for g in geometries], dtype=float)
+
+
+def _geometry_batch(geometries, areas=None, area_fn=None):
+    """Centroid lng, lat and area of a batch of footprint geometries"""
+    keep = ~shapely.is_missing(geometries) & ~shapely.is_empty(geometries)
+    geometries = geometries[keep]
+    centroids = shapely.centroid(geometries)
+    if areas is None:
+        areas = (area_fn or equal_area_m2)(geometries)
+    else:
+        areas = np.asarray(areas, dtype=float)[keep]
+    return shapely.get_x(centroids), shapely.get_y(centroids), areas
+
+
+def _open_text(path):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8")
+    return io.open(path, encoding="utf-8")
+
+
+def _is_csv(path):
+    return (path[:-3] if path.endswith(".gz") else path).endswith(".csv")
+
+
+def _property_frame(properties, columns):
+    """Frame of feature property dicts, all of them or only columns"""
+    if columns is None:
+        return pd.DataFrame([p or {} for p in properties], index=range(len(properties)))
+    return pd.DataFrame({c: [(p or {}).get(c) for p in properties] for c in columns},
+                        index=range(len(properties)))
+
+
+def feature_frames(path, batch_size=None, columns=None):
+    """Stream a footprint file as (geometries, properties) batches.
+
+    geometries are shapely polygons and properties a frame of the feature
+    properties, all of them or only columns. Reads line-delimited GeoJSON
+    (.geojsonl), GeoJSON, CSV with a WKT geometry column, and GeoParquet.
+    """
+    batch_size = batch_size or BATCH_SIZE
+    name = path[:-3] if path.endswith(".gz") else path
+
+    if name.endswith((".geojsonl", ".geojsons", ".jsonl")):
+        with _open_text(path) as f:
+            while True:
+                lines = [line for line in (f.readline() for _ in range(batch_size)) if line.strip()]
+                if not lines:
+                    break
+                if columns == []:
+                    properties = pd.DataFrame(index=range(len(lines)))
+                else:
+                    properties = _property_frame([json.loads(line).get("properties") for line in lines], columns)
+                yield shapely.from_geojson(lines, on_invalid="ignore"), properties
+
+    elif name.endswith(".csv"):
+        usecols = None if columns is None else ["geometry"] + list(columns)
+        for chunk in pd.read_csv(path, chunksize=batch_size, usecols=usecols):
+            geometries = shapely.from_wkt(chunk.pop("geometry").to_numpy())
+            yield geometries, chunk.reset_index(drop=True)
+
+    elif name.endswith(".parquet"):
+        import pyarrow.parquet as pq
+
+        parquet = pq.ParquetFile(path)
+        read = None if columns is None else ["geometry"] + list(columns)
+        for batch in parquet.iter_batches(batch_size=batch_size, columns=read):
+            properties = batch.to_pandas()
+            geometries = shapely.from_wkb(properties.pop("geometry").to_numpy())
+            yield geometries, properties
+
+    elif name.endswith(".geojson"):
+        with _open_text(path) as f:
+            for properties, wkb in feature_batches(f, batch_size):
+                yield shapely.from_wkb(wkb), _property_frame(properties, columns)
+
+    else:
+        raise ValueError(f"Unsupported footprint file: {path}")
+
+
+def geometry_batches(path, area_property=None, batch_size=None):
+    """Stream a footprint file as (geometries, areas) batches of shapely polygons.
+
+    Formats are those of feature_frames. areas holds the area_property
+    values, or is None without one.
+    """
+    columns = [area_property] if area_property else []
+    for geometries, properties in feature_frames(path, batch_size, columns):
+        areas = pd.to_numeric(properties[area_property]).to_numpy(dtype=float) if area_property else None
+        yield geometries, areas
+
+
+# === Streaming GeoJSON features ===
+
+class _TextBuffer:
+    """Sliding window over a text stream for incremental JSON decoding"""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.text = ""
+        self.pos = 0
+        self.eof = False
+
+    def more(self):
+        """Read another chunk, dropping the consumed text; False at the end of the stream"""
+        if self.eof:
+            return False
+        chunk = self.stream.read(READ_CHUNK)
+        if not chunk:
+            self.eof = True
+            return False
+        self.text = self.text[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """Next non-whitespace character without consuming it, "" at the end"""
+        while True:
+            while self.pos < len(self.text) and self.text[self.pos] in " \t\r\n":
+                self.pos += 1
+            if self.pos < len(self.text):
+                return self.text[self.pos]
+            if not self.more():
+                return ""
+
+    def expect(self, chars):
+        char = self.peek()
+        if char not in chars:
+            raise ValueError(f"Malformed GeoJSON: expected one of {chars!r}, found {char!r}")
+        self.pos += 1
+        return char
+
+    def value(self, decoder=json.JSONDecoder()):
+        """Decode the next JSON value, reading more text until it is complete.
+
+        Returns the value and its JSON text.
+        """
+        self.peek()
+        while True:
+            try:
+                value, end = decoder.raw_decode(self.text, self.pos)
+            except json.JSONDecodeError:
+                if not self.more():
+                    raise
+                continue
+            # A number at the end of the window may continue in the next chunk
+            if end < len(self.text) or not self.more():
+                text, self.pos = self.text[self.pos:end], end
+                return value, text
+
+
+def _iter_features(stream):
+    """(feature, feature JSON text) pairs of a GeoJSON stream, see iter_features"""
+    if not isinstance(stream, io.TextIOBase):
+        stream = io.TextIOWrapper(stream, encoding="utf-8", errors="replace")
+    buffer = _TextBuffer(stream)
+    buffer.expect("{")
+    members = {}
+    while buffer.peek() != "}":
+        key, _ = buffer.value()
+        buffer.expect(":")
+        if key == "features":
+            buffer.expect("[")
+            while buffer.peek() != "]":
+                yield buffer.value()
+                if buffer.expect(",]") == "]":
+                    break
+            else:
+                buffer.expect("]")
+        else:
+            members[key] = buffer.value()[0]
+        if buffer.expect(",}") == "}":
+            break
+    if members.get("type") == "Feature":
+        yield members, json.dumps(members)
+
+
+def iter_features(stream):
+    """Features of a GeoJSON FeatureCollection or Feature, parsed one at a time.
+
+    Unlike json.load, only the current feature and one READ_CHUNK of text are
+    held in memory, so the size of the file does not matter. stream is a
+    text stream, or a binary one, which is decoded as UTF-8.
+    """
+    for feature, _ in _iter_features(stream):
+        yield feature
+
+
+def property_columns(stream):
+    """Text schema of every property key in a GeoJSON stream, in order of first appearance.
+
+    A streaming first pass for write_batches, so later batches never meet
+    a property the schema lacks.
+    """
+    keys = {}
+    for feature in iter_features(stream):
+        properties = feature.get("properties")
+        if isinstance(properties, dict):
+            keys.update(dict.fromkeys(properties))
+    return {key: str for key in keys}
+
+
+def feature_batches(stream, batch_size=None):
+    """Stream GeoJSON features as (properties, wkb) batches.
+
+    properties is a list of each feature's properties (a dict, or None when
+    absent) and wkb an array of WKB geometries, None where the geometry is
+    missing or invalid. Geometries are parsed in bulk per batch by GEOS,
+    straight from the feature text.
+    """
+    batch_size = batch_size or BATCH_SIZE
+    features = _iter_features(stream)
+    while True:
+        batch = list(islice(features, batch_size))
+        if not batch:
+            break
+        wkb = shapely.to_wkb(shapely.from_geojson([text for _, text in batch], on_invalid="ignore"))
+        yield [feature.get("properties") for feature, _ in batch], wkb
+
+
+def _cast_columns(df, columns):
+    """df with exactly the declared columns, str ones as strings or None"""
+    unknown = df.columns.difference(list(columns))
+    if len(unknown):
+        raise ValueError(f"Columns not in the declared schema: {', '.join(map(str, unknown))}; add them to the recipe columns")
+    df = df.reindex(columns=list(columns))
+    for name, dtype in columns.items():
+        values = df[name]
+        if dtype is str:
+            df[name] = values.astype(object).where(values.isna(), values.astype(str))
+        else:
+            df[name] = values.astype(dtype)
+    return df
+
+
+def write_batches(dataset, frames, columns):
+    """Write frames to a DSS dataset one at a time, under a declared schema.
+
+    columns maps each output column to its dtype, str for text. Every frame
+    is cast to it, so a column that is empty in the first frame cannot fix
+    a wrong type, and a frame with an undeclared column raises rather than
+    losing it. Without any frame an empty dataset with the schema is written.
+    """
+    writer, total = None, 0
+    try:
+        for df in frames:
+            df = _cast_columns(df, columns)
+            if writer is None:
+                dataset.write_schema_from_dataframe(df)
+                writer = dataset.get_writer()
+            writer.write_dataframe(df)
+            total += len(df)
+            print(f"  Wrote {total} rows")
+    finally:
+        if writer is not None:
+            writer.close()
+    if writer is None:
+        dataset.write_with_schema(_cast_columns(pd.DataFrame(), columns))
+        print("  Wrote an empty dataset, no features were read")
+    return total
+
+
+def _no_area(geometries):
+    return np.zeros(len(geometries))
+
+
+def read_batches(path, area_property=None, batch_size=None, area_fn=None, with_area=True):
+    """Stream a footprint file as (lng, lat, area_m2) arrays of centroids, one batch at a time.
+
+    Formats are those of geometry_batches. CSVs with latitude/longitude
+    columns (Google Open Buildings) use them as centroids without parsing
+    geometry. Without an area_property the area is computed from the
+    geometry with area_fn (equal_area_m2 by default). with_area=False skips
+    areas altogether for counts only, and areas are then zero.
+    """
+    if not with_area:
+        area_property, area_fn = None, _no_area
+    area_fn = area_fn or equal_area_m2
+    if _is_csv(path) and {"latitude", "longitude"} <= set(pd.read_csv(path, nrows=0).columns):
+        for chunk in pd.read_csv(path, chunksize=batch_size or BATCH_SIZE):
+            lng, lat = chunk["longitude"].to_numpy(dtype=float), chunk["latitude"].to_numpy(dtype=float)
+            if area_property:
+                yield lng, lat, chunk[area_property].to_numpy(dtype=float)
+            elif not with_area:
+                yield lng, lat, np.zeros(len(lng))
+            else:
+                yield lng, lat, area_fn(shapely.from_wkt(chunk["geometry"].to_numpy()))
+        return
+
+    for geometries, areas in geometry_batches(path, area_property, batch_size):
+        yield _geometry_batch(geometries, areas, area_fn)
+
+
+def grid_resolution(df):
+    """H3 resolution of a hex grid frame"""
+    return int(h3_cells.get_resolution(h3_cells.to_int_index(df)[:1])[0])
+
+
+def grouped_stats(cells, areas):
+    """Building count and total area per distinct cell of per-footprint cells and areas"""
+    unique, inverse = np.unique(cells, return_inverse=True)
+    return pd.DataFrame(
+        {
+            "building_count": np.bincount(inverse, minlength=len(unique)),
+            "building_area_m2": np.bincount(inverse, weights=np.nan_to_num(areas), minlength=len(unique)),
+        },
+        index=pd.Index(unique, name="h3_index"),
+    )
+
+
+def batch_stats(lng, lat, areas, resolution):
+    """Building count and total area per cell of one batch of centroids"""
+    return grouped_stats(h3_cells.latlng_to_cells(lat, lng, resolution), areas)
+
+
+def merge_stats(partials):
+    """Sum per-cell partial totals that may share cells"""
+    partials = [p for p in partials if len(p)]
+    if not partials:
+        return pd.DataFrame(
+            {"building_count": np.zeros(0, dtype=np.int64), "building_area_m2": np.zeros(0)},
+            index=pd.Index(np.zeros(0, dtype=np.uint64), name="h3_index"),
+        )
+    return pd.concat(partials).groupby(level=0).sum()
+
+
+def cell_stats(path, resolution, area_property=None, batch_size=None, with_area=True):
+    """Building count and total footprint area per res-`resolution` cell of one file"""
+    partials, n_footprints = [], 0
+    batches = read_batches(path, area_property, batch_size, with_area=with_area)
+    for i, (lng, lat, areas) in enumerate(batches, start=1):
+        partials.append(batch_stats(lng, lat, areas, resolution))
+        n_footprints += len(lng)
+        if i % MERGE_EVERY == 0:
+            partials = [merge_stats(partials)]
+            print(f"  {os.path.basename(path)}: {n_footprints} footprints")
+    stats = merge_stats(partials)
+    print(f"Aggregated {n_footprints} footprints of {os.path.basename(path)} into {len(stats)} res-{resolution} cells")
+    return stats
+
+
+def source_stats(source, region, resolution):
+    """cell_stats of a footprint source's file for a region"""
+    return cell_stats(source_path(source, region), resolution, SOURCES[source]["area"])
+
+
+# === Many files on a process pool ===
+
+def _file_task(path, resolution, area_property, cells, with_area):
+    """Worker entry point: cell_stats of one file, keeping only the grid cells"""
+    stats = cell_stats(path, resolution, area_property, with_area=with_area)
+    if cells is not None:
+        stats = stats[np.isin(stats.index.to_numpy(dtype=np.uint64), cells)]
+    return stats
+
+
+def aggregate_files(paths, resolution, area_property=None, cells=None, workers=None, with_area=True):
+    """cell_stats of many files, one file per worker process.
+
+    paths maps a label (e.g. a state name) to its footprint file. Each
+    worker streams its own file and returns only the cells it touches,
+    restricted to the grid cells when given, so no worker scans the whole
+    grid. with_area=False counts buildings without computing any area.
+    Returns {label: per-cell stats} for merge_labelled.
+    """
+    labels = list(paths)
+    cells = None if cells is None else np.unique(np.asarray(cells, dtype=np.uint64))
+    workers = min(workers or os.cpu_count() or 1, max(len(labels), 1))
+    print(f"Aggregating {len(labels)} footprint file(s) at res {resolution} on {workers} worker(s)...")
+    args = ([paths[label] for label in labels], repeat(resolution), repeat(area_property), repeat(cells),
+            repeat(with_area))
+    if workers == 1:
+        results = list(map(_file_task, *args))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_file_task, *args))
+    return dict(zip(labels, results))
+
+
+def merge_labelled(partials, label_column):
+    """Merge-reduce labelled per-cell stats into one row per cell.
+
+    Cells that straddle several files (hexes across state lines) get the
+    summed totals, and label_column names the label that contributed the
+    most buildings to the cell.
+    """
+    partials = {label: stats for label, stats in partials.items() if len(stats)}
+    totals = merge_stats(list(partials.values()))
+    if not partials:
+        totals[label_column] = pd.Series(dtype=object)
+        return totals
+    counts = pd.concat(
+        [stats["building_count"].rename(label) for label, stats in partials.items()], axis=1
+    ).fillna(0)
+    totals[label_column] = counts.idxmax(axis=1).reindex(totals.index)
+    return totals
+
+
+def building_frame(df, stats, columns=("building_count", "building_area_m2")):
+    """DSS output frame shaped like the filterBounds results: geometry WKT, cell_id and the stats.
+
+    Grid cells without footprints get zero counts and areas.
+    """
+    cells = h3_cells.to_int_index(df)
+    stats = stats.reindex(cells)
+    out = pd.DataFrame({
+        "geometry": h3_geometry_cache.wkt(cells),
+        "cell_id": h3_cells.int_to_str(cells),
+    })
+    for name in columns:
+        values = stats[name]
+        if pd.api.types.is_numeric_dtype(values):
+            values = values.fillna(0).astype(np.int64 if name == "building_count" else float)
+        out[name] = values.to_numpy()
+    return out
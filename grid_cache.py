@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""Content-addressed cache of polyfilled H3 cell sets.
+
+Entries are keyed by a hash of the simplified boundary geometry, the H3
+resolution and the simplify tolerance, so rebuilding or renaming a grid
+dataset reuses the cells as long as the boundary itself is unchanged.
+Each boundary name keeps a small manifest of its current keys; when its
+geometry changes, only that boundary's stale entries are removed.
+"""
+import hashlib
+import json
+import os
+
+import numpy as np
+import shapely
+
+import h3_cells
+
+CACHE_DIR = os.environ.get(
+    "H3_GRID_CACHE", "/home/hid24/dss_data/managed_folders/DISSERTATION/h3_grid_cache"
+)
+
+
+def boundary_key(parts, resolution, tolerance):
+    """sha256 of the normalised boundary parts, resolution and tolerance"""
+    digest = hashlib.sha256(f"res={resolution};tol={tolerance!r};".encode())
+    # Normalise and sort so part order and ring start points do not change the key
+    for wkb in sorted(shapely.to_wkb(shapely.normalize(np.asarray(parts, dtype=object)))):
+        digest.update(wkb)
+    return digest.hexdigest()
+
+
+def _entry_path(key):
+    return os.path.join(CACHE_DIR, key[:2], f"{key}.npy")
+
+
+def _manifest_path(name):
+    return os.path.join(CACHE_DIR, "names", f"{name}.json")
+
+
+def _read_manifest(name):
+    try:
+        with open(_manifest_path(name)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def get(key):
+    """Cached cell set for a key, or None on a miss"""
+    try:
+        cells = np.load(_entry_path(key))
+    except FileNotFoundError:
+        return None
+    return set(h3_cells.int_to_str(cells))
+
+
+def put(key, cells, name, resolution):
+    """Store a cell set and point the boundary's manifest at it"""
+    path = _entry_path(key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        np.save(f, np.sort(h3_cells.str_to_int(list(cells))))
+    os.replace(tmp, path)
+
+    manifest = _read_manifest(name)
+    old_key = manifest.get(str(resolution))
+    manifest[str(resolution)] = key
+    os.makedirs(os.path.dirname(_manifest_path(name)), exist_ok=True)
+    with open(_manifest_path(name), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+    if old_key and old_key != key and not _referenced(old_key) and os.path.exists(_entry_path(old_key)):
+        os.remove(_entry_path(old_key))
+        print(f"  Removed stale grid cache entry for {name} at res {resolution}")
+
+
+def _referenced(key):
+    """Whether any boundary manifest still points at key"""
+    names_dir = os.path.join(CACHE_DIR, "names")
+    for filename in os.listdir(names_dir):
+        with open(os.path.join(names_dir, filename)) as f:
+            if key in json.load(f).values():
+                return True
+    return False
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""Compact integer H3 cell ids for hex grid datasets.
+
+Grid datasets in the compact format keep one integer column, h3_index, and
+no geometry. Hexagons are only built when a recipe asks for them, and
+with_wkt() gives older recipes the legacy cell_id/geometry columns back.
+H3 cell ids always have their top bit clear, so they fit in the signed
+bigint columns DSS uses without loss.
+"""
+import dataiku
+import h3.api.basic_int as h3_int
+import numpy as np
+import pandas as pd
+
+import h3_geometry_cache
+
+INDEX_COL = "h3_index"
+
+# === H3 index bit layout (see the H3 index specification) ===
+_RES_OFFSET = 52
+_RES_MASK = np.uint64(0xF << _RES_OFFSET)
+_DIGIT_BITS = 3
+_MAX_RES = 15
+
+
+def str_to_int(cell_ids):
+    """Convert H3 hex strings to a uint64 array"""
+    return np.fromiter((int(c, 16) for c in cell_ids), dtype=np.uint64, count=len(cell_ids))
+
+
+def int_to_str(cells):
+    """Convert uint64 H3 ids back to the usual hex strings"""
+    return [format(int(c), "x") for c in cells]
+
+
+def get_resolution(cells):
+    """Resolution of each uint64 H3 id"""
+    cells = np.asarray(cells, dtype=np.uint64)
+    return ((cells & _RES_MASK) >> np.uint64(_RES_OFFSET)).astype(np.int8)
+
+
+def cell_to_parent(cells, res):
+    """Vectorised cell_to_parent: rewrite the resolution field and blank the finer digits"""
+    cells = np.asarray(cells, dtype=np.uint64)
+    unused_digits = np.uint64((1 << ((_MAX_RES - res) * _DIGIT_BITS)) - 1)
+    return (cells & ~_RES_MASK) | np.uint64(res << _RES_OFFSET) | unused_digits
+
+
+def latlng_to_cells(lat, lng, res):
+    """uint64 H3 ids of the cells containing each (lat, lng) point"""
+    return np.fromiter(
+        (h3_int.latlng_to_cell(y, x, res) for y, x in zip(lat, lng)),
+        dtype=np.uint64, count=len(lat),
+    )
+
+
+def as_int_ids(values):
+    """uint64 H3 ids from a column holding either integer ids or hex strings"""
+    values = pd.Series(values)
+    if pd.api.types.is_integer_dtype(values):
+        return values.to_numpy(dtype=np.uint64)
+    return str_to_int(values.astype(str).tolist())
+
+
+def to_int_index(df, col="cell_id"):
+    """Return the h3_index column of a grid frame, converting string ids if needed"""
+    if INDEX_COL in df.columns:
+        return df[INDEX_COL].to_numpy(dtype=np.uint64)
+    return as_int_ids(df[col])
+
+
+def grid_frame(cells, **columns):
+    """Compact grid frame: h3_index plus any extra per-cell columns"""
+    cells = np.asarray(cells, dtype=np.uint64)
+    df = pd.DataFrame({INDEX_COL: cells.astype(np.int64)})
+    for name, values in columns.items():
+        df[name] = values
+    return df
+
+
+def read_grid(dataset_name, columns=None):
+    """Read a hex grid dataset as a compact frame keyed by h3_index.
+
+    Works on both formats: legacy cell_id strings are converted and the
+    WKT geometry column is dropped without being parsed.
+    """
+    df = dataiku.Dataset(dataset_name).get_dataframe(columns=columns)
+    df[INDEX_COL] = to_int_index(df)
+    return df.drop(columns=[c for c in ("cell_id", "geometry") if c in df.columns])
+
+
+def with_wkt(df):
+    """Adapter for older recipes: add the legacy cell_id and WKT geometry columns"""
+    cells = df[INDEX_COL].to_numpy(dtype=np.uint64)
+    df = df.copy()
+    df["cell_id"] = int_to_str(cells)
+    df["geometry"] = h3_geometry_cache.wkt(cells)
+    return df
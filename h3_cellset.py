@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+"""Compacted H3 cell sets with fast membership and set operations.
+
+A CellSet holds a grid at one resolution in compacted form: sorted
+uint64 ids at mixed resolutions, where every full group of siblings is
+replaced by its parent. Interior regions of a country collapse to a few
+coarse cells, so the set is usually a small fraction of the expanded grid.
+
+Membership is answered without expanding: a cell is in the set when its
+parent at one of the stored resolutions is. Intersection, difference and
+union work on the compact form and only expand the few cells that
+partially overlap the other set.
+"""
+import h3.api.basic_int as h3_int
+import numpy as np
+
+import h3_cells
+
+
+def _compact(cells):
+    """Compact uint64 cells of mixed resolutions, replacing full sibling groups by their parent.
+
+    h3 compact_cells expects a single resolution, which the results of set
+    operations do not have, so groups are merged level by level here.
+    """
+    cells = np.unique(np.asarray(cells, dtype=np.uint64))
+    if not len(cells):
+        return cells
+    cell_res = h3_cells.get_resolution(cells)
+    for level in range(int(cell_res.max()), 0, -1):
+        at_level = cell_res == level
+        if not at_level.any():
+            continue
+        parents, pos, counts = np.unique(
+            h3_cells.cell_to_parent(cells[at_level], level - 1), return_inverse=True, return_counts=True
+        )
+        n_children = np.array([6 if h3_int.is_pentagon(int(p)) else 7 for p in parents])
+        full = counts == n_children
+        if not full.any():
+            continue
+        merged = np.flatnonzero(at_level)[full[pos]]
+        cells = np.concatenate([np.delete(cells, merged), parents[full]])
+        cells = np.sort(cells)
+        cell_res = h3_cells.get_resolution(cells)
+    return cells
+
+
+def _covered(cells, compact, levels):
+    """Whether each cell equals or descends from a cell in a sorted compact array"""
+    cells = np.asarray(cells, dtype=np.uint64)
+    cell_res = h3_cells.get_resolution(cells)
+    hit = np.zeros(len(cells), dtype=bool)
+    if not len(compact):
+        return hit
+    for level in levels:
+        sel = np.flatnonzero(~hit & (cell_res >= level))
+        if not len(sel):
+            continue
+        parents = h3_cells.cell_to_parent(cells[sel], int(level))
+        pos = np.minimum(np.searchsorted(compact, parents), len(compact) - 1)
+        hit[sel[compact[pos] == parents]] = True
+    return hit
+
+
+class CellSet:
+    """Set of H3 cells at one resolution, stored compacted"""
+
+    def __init__(self, compact, resolution):
+        self.compact = np.unique(np.asarray(compact, dtype=np.uint64))
+        self.resolution = int(resolution)
+        self.levels = np.unique(h3_cells.get_resolution(self.compact))
+
+    # === Construction and expansion ===
+    @classmethod
+    def from_cells(cls, cells, resolution=None):
+        """Compact a grid given as uint64 ids or hex strings, all at one resolution"""
+        cells = np.unique(h3_cells.as_int_ids(cells))
+        if resolution is None:
+            if not len(cells):
+                raise ValueError("An empty CellSet needs an explicit resolution.")
+            resolution = int(h3_cells.get_resolution(cells[:1])[0])
+        return cls(_compact(cells), resolution)
+
+    @classmethod
+    def from_grid(cls, df):
+        """CellSet of a grid frame in either the legacy or the compact format"""
+        return cls.from_cells(h3_cells.to_int_index(df))
+
+    def cells(self):
+        """Sorted uint64 ids of the expanded grid"""
+        expanded = h3_int.uncompact_cells([int(c) for c in self.compact], self.resolution)
+        return np.sort(np.fromiter(expanded, dtype=np.uint64, count=len(expanded)))
+
+    def _expand(self, compact):
+        expanded = h3_int.uncompact_cells([int(c) for c in compact], self.resolution)
+        return np.fromiter(expanded, dtype=np.uint64, count=len(expanded))
+
+    # === Membership ===
+    def contains(self, cells):
+        """Boolean array: whether each cell (at this resolution or finer) is in the set"""
+        return _covered(h3_cells.as_int_ids(cells), self.compact, self.levels)
+
+    def contains_points(self, lat, lng):
+        """Boolean array: whether each (lat, lng) point falls in a cell of the set"""
+        return self.contains(h3_cells.latlng_to_cells(lat, lng, self.resolution))
+
+    def __contains__(self, cell):
+        return bool(self.contains([cell])[0])
+
+    def __len__(self):
+        # Expanded size, counted per compact cell so pentagons are handled by H3
+        return sum(h3_int.cell_to_children_size(int(c), self.resolution) for c in self.compact)
+
+    def __eq__(self, other):
+        return (isinstance(other, CellSet) and self.resolution == other.resolution
+                and np.array_equal(self.compact, other.compact))
+
+    def __repr__(self):
+        return f"CellSet(resolution={self.resolution}, compact_cells={len(self.compact)})"
+
+    # === Set operations ===
+    def _check(self, other):
+        if self.resolution != other.resolution:
+            raise ValueError(f"Cannot combine res-{self.resolution} and res-{other.resolution} cell sets.")
+
+    def intersection(self, other):
+        """Cells in both sets: each side's cells that lie inside the other side"""
+        self._check(other)
+        mine = self.compact[_covered(self.compact, other.compact, other.levels)]
+        theirs = other.compact[_covered(other.compact, self.compact, self.levels)]
+        return CellSet(np.concatenate([mine, theirs]), self.resolution)
+
+    def difference(self, other):
+        """Cells in this set but not in other; only partially covered cells are expanded"""
+        self._check(other)
+        covered = _covered(self.compact, other.compact, other.levels)
+        # Compact cells of self that strictly contain a finer cell of other are split
+        inner = other.compact[_covered(other.compact, self.compact, self.levels)]
+        inner_res = h3_cells.get_resolution(inner)
+        ancestors = [np.array([], dtype=np.uint64)] + [
+            h3_cells.cell_to_parent(inner[inner_res > level], int(level)) for level in self.levels
+        ]
+        partial = np.isin(self.compact, np.concatenate(ancestors)) & ~covered
+
+        split = self._expand(self.compact[partial])
+        split = split[~_covered(split, other.compact, other.levels)]
+        return CellSet(_compact(np.concatenate([self.compact[~covered & ~partial], split])), self.resolution)
+
+    def union(self, other):
+        """Cells in either set"""
+        self._check(other)
+        mine = self.compact[~_covered(self.compact, other.compact, other.levels)]
+        mine_levels = np.unique(h3_cells.get_resolution(mine))
+        theirs = other.compact[~_covered(other.compact, mine, mine_levels)]
+        return CellSet(_compact(np.concatenate([mine, theirs])), self.resolution)
+
+    __and__ = intersection
+    __sub__ = difference
+    __or__ = union
+
+    # === Persistence ===
+    def save(self, path):
+        """Store the compact ids and the grid resolution in one .npz file"""
+        np.savez(path, compact=self.compact, resolution=np.int8(self.resolution))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data["compact"], int(data["resolution"]))
@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+"""On-disk cache of H3 cell boundaries shared by every recipe.
+
+Boundaries live under CACHE_DIR as memory-mapped NumPy segments. Each
+segment has three files:
+
+- <seg>_ids.npy: sorted uint64 cell ids
+- <seg>_verts.npy: (n, MAX_VERTS, 2) lng/lat vertex arrays
+- <seg>_nverts.npy: the vertex count of each cell
+
+Lookups read fixed-size pages of a segment and keep the most recently used
+pages in memory. Cells missing from the cache are computed once with H3 and
+appended as a new segment, so later recipes only pay for a lookup.
+
+Worker processes share the directory. Listing and writing segments take a
+shared lock on LOCK_FILE and compaction an exclusive one, so a compaction
+never removes segments another process is opening, writing or merging.
+"""
+import fcntl
+import os
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import geopandas as gpd
+import h3.api.basic_int as h3_int
+import numpy as np
+import shapely
+
+import h3_cells
+
+CACHE_DIR = os.environ.get(
+    "H3_GEOMETRY_CACHE", "/home/hid24/dss_data/managed_folders/DISSERTATION/h3_geometry_cache"
+)
+MAX_VERTS = 10      # hexagons crossing an icosahedron edge have up to 10 vertices
+PAGE_ROWS = 4096    # cells per in-memory page
+MAX_PAGES = 256     # pages kept hot before the least recently used is evicted
+MAX_SEGMENTS = 32   # segments are merged into one beyond this
+LOCK_FILE = ".lock"
+
+
+def compute_boundaries(cells):
+    """Vertex arrays for uint64 cells straight from H3"""
+    verts = np.full((len(cells), MAX_VERTS, 2), np.nan)
+    nverts = np.zeros(len(cells), dtype=np.uint8)
+    for i, cell in enumerate(cells):
+        boundary = h3_int.cell_to_boundary(int(cell))
+        nverts[i] = len(boundary)
+        verts[i, :len(boundary)] = [(lng, lat) for lat, lng in boundary]
+    return verts, nverts
+
+
+def boundaries_to_polygons(verts, nverts):
+    """Build shapely hexagons from vertex arrays in one vectorised call"""
+    n = len(nverts)
+    nverts = nverts.astype(np.int64)
+    # Close each ring by repeating its first vertex after the last one
+    closed = np.concatenate([verts, verts[:, :1]], axis=1)
+    closed[np.arange(n), nverts] = verts[:, 0]
+    mask = np.arange(MAX_VERTS + 1)[None, :] <= nverts[:, None]
+    rings = shapely.linearrings(closed[mask], indices=np.repeat(np.arange(n), nverts + 1))
+    return shapely.polygons(rings)
+
+
+class GeometryCache:
+    """Memory-mapped cell boundary store with an LRU of hot pages"""
+
+    def __init__(self, path=CACHE_DIR, max_pages=MAX_PAGES):
+        self.path = path
+        self.max_pages = max_pages
+        self._segments = None
+        self._pages = OrderedDict()
+        os.makedirs(path, exist_ok=True)
+
+    def _file(self, name, part):
+        return os.path.join(self.path, f"{name}_{part}.npy")
+
+    def _open_segment(self, name):
+        return {
+            "name": name,
+            "ids": np.load(self._file(name, "ids"), mmap_mode="r"),
+            "verts": np.load(self._file(name, "verts"), mmap_mode="r"),
+            "nverts": np.load(self._file(name, "nverts"), mmap_mode="r"),
+        }
+
+    @contextmanager
+    def _lock(self, exclusive=False):
+        with open(os.path.join(self.path, LOCK_FILE), "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _list_segments(self):
+        # The ids file is written last, so its presence marks a complete segment
+        names = sorted(f[:-len("_ids.npy")] for f in os.listdir(self.path) if f.endswith("_ids.npy"))
+        segments = []
+        for name in names:
+            try:
+                segments.append(self._open_segment(name))
+            except FileNotFoundError:
+                continue    # removed by a compaction since the listing
+        return segments
+
+    def _load_segments(self):
+        with self._lock():
+            self._segments = self._list_segments()
+        self._pages.clear()
+
+    def _page(self, segment, page_no):
+        key = (segment["name"], page_no)
+        page = self._pages.get(key)
+        if page is not None:
+            self._pages.move_to_end(key)
+            return page
+
+        rows = slice(page_no * PAGE_ROWS, (page_no + 1) * PAGE_ROWS)
+        page = (np.array(segment["verts"][rows]), np.array(segment["nverts"][rows]))
+        self._pages[key] = page
+        if len(self._pages) > self.max_pages:
+            self._pages.popitem(last=False)
+        return page
+
+    def _write_segment(self, cells, verts, nverts):
+        name = f"seg_{uuid.uuid4().hex}"
+        for part, values in (("verts", verts), ("nverts", nverts), ("ids", cells)):
+            tmp = self._file(name, part) + ".tmp"
+            with open(tmp, "wb") as f:
+                np.save(f, values)
+            os.replace(tmp, self._file(name, part))
+        self._segments.append(self._open_segment(name))
+
+    def compact(self):
+        """Merge every segment into one so lookups search a single file.
+
+        Segments are re-listed under an exclusive lock, so a compaction in
+        another process since this one loaded them is not repeated.
+        """
+        with self._lock(exclusive=True):
+            old = self._list_segments()
+            self._pages.clear()
+            if len(old) <= 1:
+                self._segments = old
+                return
+            cells = np.concatenate([s["ids"] for s in old])
+            cells, first = np.unique(cells, return_index=True)
+            verts = np.concatenate([s["verts"] for s in old])[first]
+            nverts = np.concatenate([s["nverts"] for s in old])[first]
+
+            self._segments = []
+            self._write_segment(cells, verts, nverts)
+            for segment in old:
+                for part in ("ids", "verts", "nverts"):
+                    try:
+                        os.remove(self._file(segment["name"], part))
+                    except FileNotFoundError:
+                        pass
+
+    def boundaries(self, cells):
+        """(verts, nverts) for each cell, computing and storing any that are missing"""
+        if self._segments is None:
+            self._load_segments()
+        cells = h3_cells.as_int_ids(cells)
+        n = len(cells)
+        verts = np.empty((n, MAX_VERTS, 2))
+        nverts = np.zeros(n, dtype=np.uint8)
+        found = np.zeros(n, dtype=bool)
+
+        for segment in self._segments:
+            todo = np.flatnonzero(~found)
+            if not len(todo) or not len(segment["ids"]):
+                break
+            pos = np.minimum(np.searchsorted(segment["ids"], cells[todo]), len(segment["ids"]) - 1)
+            hit = segment["ids"][pos] == cells[todo]
+            rows, pos = todo[hit], pos[hit]
+
+            page_nos = pos // PAGE_ROWS
+            for page_no in np.unique(page_nos):
+                sel = page_nos == page_no
+                page_verts, page_nverts = self._page(segment, int(page_no))
+                offset = pos[sel] - page_no * PAGE_ROWS
+                verts[rows[sel]] = page_verts[offset]
+                nverts[rows[sel]] = page_nverts[offset]
+            found[rows] = True
+
+        missing = np.flatnonzero(~found)
+        if len(missing):
+            new_cells = np.unique(cells[missing])
+            new_verts, new_nverts = compute_boundaries(new_cells)
+            with self._lock():
+                self._write_segment(new_cells, new_verts, new_nverts)
+            pos = np.searchsorted(new_cells, cells[missing])
+            verts[missing] = new_verts[pos]
+            nverts[missing] = new_nverts[pos]
+            if len(self._segments) > MAX_SEGMENTS:
+                self.compact()
+        return verts, nverts
+
+    def polygons(self, cells):
+        """Shapely hexagons for the given cells"""
+        return boundaries_to_polygons(*self.boundaries(cells))
+
+    def wkt(self, cells):
+        """WKT hexagons for the given cells, at full precision like .wkt"""
+        return shapely.to_wkt(self.polygons(cells), rounding_precision=-1).tolist()
+
+
+# === Module-level cache shared by every recipe in the process ===
+_cache = None
+
+
+def default_cache():
+    global _cache
+    if _cache is None:
+        _cache = GeometryCache()
+    return _cache
+
+
+def polygons(cells):
+    return default_cache().polygons(cells)
+
+
+def wkt(cells):
+    return default_cache().wkt(cells)
+
+
+def hex_gdf(df):
+    """GeoDataFrame of a hex grid frame with geometry from the cache, not from WKT"""
+    return gpd.GeoDataFrame(df, geometry=polygons(h3_cells.to_int_index(df)), crs="EPSG:4326")
@@ -0,0 +1,382 @@
+# -*- coding: utf-8 -*-
+"""Shared H3 grid-building helpers used by the compute_*_h3_* recipes."""
+import math
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from itertools import repeat
+
+import dataiku
+import h3
+import numpy as np
+import pandas as pd
+import shapely
+from shapely.geometry import box
+
+import grid_cache
+import h3_cells
+import h3_geometry_cache
+
+# === Defaults matching the original per-recipe loops ===
+SIMPLIFY_TOLERANCE = 0.01   # degrees, same as poly.simplify(tolerance=0.01)
+TILE_SIZE_DEG = 5.0         # parts whose bounding box exceeds this are cut into tiles
+STREAM_CHUNK_ROWS = 200000  # rows per write when streaming a grid to DSS
+MIN_LAND_FRACTION = 0.1     # below this a per-land-km2 density is left empty
+
+
+def boundary_parts(gdf, tolerance=SIMPLIFY_TOLERANCE):
+    """Union a boundary GeoDataFrame and return its simplified, valid polygon parts"""
+    geom = gdf.unary_union
+    geoms = [geom] if geom.geom_type == "Polygon" else list(geom.geoms)
+
+    parts = []
+    for i, poly in enumerate(geoms):
+        simple_poly = poly.simplify(tolerance=tolerance, preserve_topology=True)
+        if simple_poly.is_empty or not simple_poly.is_valid:
+            print(f"  Skipping part {i+1}: empty or invalid after simplification.")
+            continue
+        parts.append(simple_poly)
+    return parts
+
+
+def _polygons(geom):
+    """Flatten the result of an intersection into a list of Polygons"""
+    if geom.is_empty:
+        return []
+    if geom.geom_type == "Polygon":
+        return [geom]
+    if hasattr(geom, "geoms"):
+        return [g for sub in geom.geoms for g in _polygons(sub)]
+    return []
+
+
+def split_into_tiles(poly, tile_size=TILE_SIZE_DEG):
+    """Cut a polygon into bounding-box tiles no larger than tile_size degrees"""
+    minx, miny, maxx, maxy = poly.bounds
+    if maxx - minx <= tile_size and maxy - miny <= tile_size:
+        return [poly]
+
+    tiles = []
+    x = minx
+    while x < maxx:
+        y = miny
+        while y < maxy:
+            tile = box(x, y, min(x + tile_size, maxx), min(y + tile_size, maxy))
+            tiles.extend(_polygons(poly.intersection(tile)))
+            y += tile_size
+        x += tile_size
+    return tiles
+
+
+def _polyfill_task(poly, resolution):
+    """Worker entry point: polyfill one tile, returning (cells, error message)"""
+    try:
+        return h3.geo_to_cells(poly, res=resolution), None
+    except Exception as e:
+        return [], str(e)
+
+
+def polyfill(parts, resolution, workers=None, tile_size=TILE_SIZE_DEG,
+             cache_name=None, tolerance=SIMPLIFY_TOLERANCE):
+    """Polyfill polygon parts at one resolution across a process pool.
+
+    Large parts are cut into tiles so the work spreads evenly over the pool.
+    A cell belongs to whichever tile holds its centre, so merging the per-tile
+    sets gives the same result as polyfilling each part whole.
+
+    With cache_name (usually the boundary dataset name) the result is looked
+    up in, and stored to, grid_cache; tolerance is the one the parts were
+    simplified with and is part of the cache key. Grids with failed tiles
+    are not stored, so the next run retries them.
+    """
+    if cache_name is not None:
+        key = grid_cache.boundary_key(parts, resolution, tolerance)
+        cached = grid_cache.get(key)
+        if cached is not None:
+            print(f"Reusing {len(cached)} cached res-{resolution} hexes for {cache_name}")
+            return cached
+
+    tasks = [tile for poly in parts for tile in split_into_tiles(poly, tile_size)]
+    # Largest tiles first so the pool is not left waiting on one straggler
+    tasks.sort(key=lambda p: p.area, reverse=True)
+
+    workers = workers or os.cpu_count() or 1
+    print(f"Polyfilling {len(parts)} part(s) as {len(tasks)} tile(s) at H3 resolution {resolution} "
+          f"on {workers} worker(s)...")
+
+    all_cells = set()
+    failed = 0
+    if workers == 1 or len(tasks) == 1:
+        results = (_polyfill_task(poly, resolution) for poly in tasks)
+        for cells, error in results:
+            if error:
+                failed += 1
+                print(f"  Failed tile: {error}")
+            all_cells.update(cells)
+    else:
+        chunksize = max(1, len(tasks) // (workers * 4))
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for cells, error in pool.map(_polyfill_task, tasks, repeat(resolution), chunksize=chunksize):
+                if error:
+                    failed += 1
+                    print(f"  Failed tile: {error}")
+                all_cells.update(cells)
+
+    print(f"  Generated {len(all_cells)} hexes ({failed} tile(s) failed)")
+    if not all_cells:
+        raise RuntimeError("No hexes generated. Try reducing resolution or adjusting geometry.")
+    if cache_name is not None:
+        if failed:
+            # A grid with holes from transient tile failures must not be reused
+            print(f"  Not caching {cache_name}: {failed} tile(s) failed")
+        else:
+            grid_cache.put(key, all_cells, cache_name, resolution)
+    return all_cells
+
+
+# === Streaming mode for continental and world grids ===
+
+def stream_tile_size(resolution):
+    """Tile edge in degrees that keeps roughly the same cell count per tile at any resolution"""
+    return min(TILE_SIZE_DEG, TILE_SIZE_DEG * 7 ** ((7 - resolution) / 2))
+
+
+def _tile_grid(parts, tile_size):
+    """Group the parts' pieces by the global tile-grid square they fall in"""
+    tiles = {}
+    for poly in parts:
+        minx, miny, maxx, maxy = poly.bounds
+        for i in range(math.floor(minx / tile_size), math.floor(maxx / tile_size) + 1):
+            for j in range(math.floor(miny / tile_size), math.floor(maxy / tile_size) + 1):
+                square = box(i * tile_size, j * tile_size, (i + 1) * tile_size, (j + 1) * tile_size)
+                pieces = _polygons(poly.intersection(square))
+                if pieces:
+                    tiles.setdefault((i, j), []).extend(pieces)
+    return tiles
+
+
+def _polyfill_tile_task(key, pieces, resolution, tile_size):
+    """Worker entry point: the cells whose centre lies in one grid square.
+
+    Squares are half-open, so a cell on a shared edge is owned by exactly one
+    of them and the streamed chunks never repeat a cell.
+    """
+    try:
+        cells = set()
+        for poly in pieces:
+            cells.update(h3.geo_to_cells(poly, res=resolution))
+        x0, y0 = key[0] * tile_size, key[1] * tile_size
+        owned = []
+        for cell in cells:
+            lat, lng = h3.cell_to_latlng(cell)
+            if x0 <= lng < x0 + tile_size and y0 <= lat < y0 + tile_size:
+                owned.append(cell)
+        return owned, None
+    except Exception as e:
+        return [], str(e)
+
+
+def iter_polyfill(parts, resolution, workers=None, tile_size=None):
+    """Yield the polyfill one grid square at a time instead of as one big set.
+
+    At most two squares per worker are in flight, so memory stays bounded by
+    the tile size however large the boundary is. Failed squares are counted
+    and raise once the stream ends, so the recipe fails instead of leaving a
+    grid with holes.
+    """
+    tile_size = tile_size or stream_tile_size(resolution)
+    tiles = _tile_grid(parts, tile_size)
+    workers = workers or os.cpu_count() or 1
+    print(f"Streaming polyfill of {len(parts)} part(s) over {len(tiles)} {tile_size:.2f}-degree tile(s) "
+          f"at H3 resolution {resolution} on {workers} worker(s)...")
+
+    failed = 0
+
+    def results(done):
+        nonlocal failed
+        for future in done:
+            cells, error = future.result()
+            if error:
+                failed += 1
+                print(f"  Failed tile: {error}")
+            if cells:
+                yield cells
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = set()
+        for key, pieces in tiles.items():
+            pending.add(pool.submit(_polyfill_tile_task, key, pieces, resolution, tile_size))
+            if len(pending) >= workers * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                yield from results(done)
+        yield from results(pending)
+
+    if failed:
+        raise RuntimeError(f"{failed} of {len(tiles)} tile(s) failed; the streamed grid has holes")
+
+
+def write_grid_stream(dataset_name, cell_chunks, compact=False, chunk_rows=STREAM_CHUNK_ROWS, parts=None):
+    """Write streamed cells to a DSS dataset in chunks of about chunk_rows rows"""
+    dataset = dataiku.Dataset(dataset_name)
+    buffer, total, writer = [], 0, None
+    try:
+        for cells in cell_chunks:
+            buffer.extend(cells)
+            if len(buffer) < chunk_rows:
+                continue
+            writer = _write_chunk(dataset, writer, cells_to_frame(buffer, compact=compact, parts=parts))
+            total += len(buffer)
+            buffer = []
+        if buffer:
+            writer = _write_chunk(dataset, writer, cells_to_frame(buffer, compact=compact, parts=parts))
+            total += len(buffer)
+    finally:
+        if writer is not None:
+            writer.close()
+
+    if not total:
+        raise RuntimeError("No hexes generated. Try reducing resolution or adjusting geometry.")
+    print(f"  Wrote {total} hexes to {dataset_name}")
+    return total
+
+
+def _write_chunk(dataset, writer, df):
+    """Write one chunk, setting the schema from the first one"""
+    if writer is None:
+        dataset.write_schema_from_dataframe(df)
+        writer = dataset.get_writer()
+    writer.write_dataframe(df)
+    print(f"  Wrote chunk of {len(df)} hexes")
+    return writer
+
+
+def derive_resolutions(fine_cells, resolutions, coverage="centroid"):
+    """Derive coarser grids from one fine polyfill through cell_to_parent.
+
+    Returns {resolution: Series of coverage indexed by cell_id}, where coverage
+    is the share of a parent's fine children that were polyfilled. The
+    coverage mode decides which partially covered parents are kept:
+
+    - "centroid": keep a parent when its centre child is in the fine set,
+      which is exactly what a direct polyfill at the coarse resolution gives
+    - "any": keep every parent with at least one fine child
+    - a float in (0, 1]: keep parents whose coverage reaches that share
+    """
+    fine_res = max(resolutions)
+    fine = pd.Series(sorted(fine_cells), name="cell_id")
+    fine_set = set(fine)
+
+    grids = {}
+    for res in sorted(set(resolutions), reverse=True):
+        if res == fine_res:
+            grids[res] = pd.Series(1.0, index=fine.values, name="coverage")
+            continue
+
+        parents = pd.Series([h3.cell_to_parent(c, res) for c in fine], name="cell_id")
+        counts = parents.value_counts().sort_index()
+        sizes = [h3.cell_to_children_size(p, fine_res) for p in counts.index]
+        share = (counts / sizes).rename("coverage")
+
+        if coverage == "centroid":
+            keep = [h3.cell_to_center_child(p, fine_res) in fine_set for p in share.index]
+        elif coverage == "any":
+            keep = [True] * len(share)
+        else:
+            keep = (share >= float(coverage)).tolist()
+
+        grids[res] = share[keep]
+        print(f"  Derived {len(grids[res])} res-{res} cells from {len(fine)} res-{fine_res} cells")
+    return grids
+
+
+def build_grids(parts, resolutions, coverage="centroid", workers=None, cache_name=None):
+    """Polyfill once at the finest resolution and derive every coarser grid"""
+    fine_cells = polyfill(parts, max(resolutions), workers=workers, cache_name=cache_name)
+    return derive_resolutions(fine_cells, resolutions, coverage=coverage)
+
+
+def superimpose(fine_cells, res_fine, res_coarse):
+    """Normalised child->parent tables for a fine grid over a coarse one.
+
+    Parent ids come from a vectorised cell_to_parent on the integer ids, and
+    each parent hexagon is built once, so the parent table grows with the
+    number of unique parents rather than the number of children.
+    Returns (links_df, parents_df).
+    """
+    fine_cells = sorted(fine_cells)
+    fine_ints = h3_cells.str_to_int(fine_cells)
+    parent_ints = h3_cells.cell_to_parent(fine_ints, res_coarse)
+    unique_parents, parent_pos = np.unique(parent_ints, return_inverse=True)
+    parent_ids = np.array(h3_cells.int_to_str(unique_parents), dtype=object)
+
+    links_df = pd.DataFrame({
+        f"h3_res_{res_fine}": fine_cells,
+        f"geometry_res_{res_fine}": h3_geometry_cache.wkt(fine_ints),
+        f"h3_res_{res_coarse}": parent_ids[parent_pos],
+    })
+    parents_df = pd.DataFrame({
+        f"h3_res_{res_coarse}": parent_ids,
+        f"geometry_res_{res_coarse}": h3_geometry_cache.wkt(unique_parents),
+        "n_children": np.bincount(parent_pos),
+    })
+    return links_df, parents_df
+
+
+def classify_cells(cells, parts):
+    """Label cells as interior or boundary-crossing against the polyfilled parts.
+
+    Returns (is_interior, land_fraction) arrays. Interior cells come from one
+    prepared within-query on an STRtree of the parts and get a land fraction
+    of 1 without any clipping. Only the boundary-crossing band is intersected
+    with the parts it touches to measure its land share.
+    """
+    hexes = h3_geometry_cache.polygons(cells)
+    parts = np.asarray(parts, dtype=object)
+    tree = shapely.STRtree(parts)
+
+    is_interior = np.zeros(len(hexes), dtype=bool)
+    is_interior[tree.query(hexes, predicate="within")[0]] = True
+    land_fraction = np.ones(len(hexes))
+
+    edge = np.flatnonzero(~is_interior)
+    if len(edge):
+        hex_pos, part_pos = tree.query(hexes[edge], predicate="intersects")
+        clipped = shapely.area(shapely.intersection(hexes[edge][hex_pos], parts[part_pos]))
+        land_area = np.bincount(hex_pos, weights=clipped, minlength=len(edge))
+        land_fraction[edge] = np.minimum(land_area / shapely.area(hexes[edge]), 1.0)
+
+    print(f"  {is_interior.sum()} interior and {len(edge)} boundary-crossing cells")
+    return is_interior, land_fraction
+
+
+def land_density(values, hex_area_km2, land_fraction, min_fraction=MIN_LAND_FRACTION):
+    """values per km2 of land in each hex, NaN where the land fraction is below min_fraction.
+
+    Slivers of coast or border would otherwise divide by a tiny land area
+    and inflate the density many times over.
+    """
+    land_fraction = np.asarray(land_fraction, dtype=float)
+    land_area = hex_area_km2 * np.where(land_fraction >= min_fraction, land_fraction, np.nan)
+    return np.asarray(values, dtype=float) / land_area
+
+
+def cells_to_frame(cells, coverage=None, compact=False, parts=None):
+    """Build the DSS output frame: one row per cell with its WKT hexagon
+
+    Passing the coverage Series from derive_resolutions adds it as a column.
+    Passing the polyfilled parts adds the is_interior and land_fraction
+    columns from classify_cells. With compact=True the frame is in the
+    h3_cells format instead: an integer h3_index column and no geometry.
+    """
+    cells = sorted(cells)
+    if compact:
+        df = h3_cells.grid_frame(h3_cells.str_to_int(cells))
+    else:
+        df = pd.DataFrame({
+            "cell_id": cells,
+            "geometry": h3_geometry_cache.wkt(cells),
+        })
+    if coverage is not None:
+        df["coverage"] = coverage.reindex(cells).to_numpy()
+    if parts is not None:
+        df["is_interior"], df["land_fraction"] = classify_cells(cells, parts)
+    return df
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""Single-pass extraction of every raster feature of a hex grid.
+
+Instead of one zonal recipe per layer followed by joins, extract_features
+walks the grid once. The pixel window of each layer is cut into the same
+number of row tiles, so tile i of every layer covers roughly the same band
+of the grid. Each worker task reads tile i of all configured layers and
+reduces them with the layers' pixel labels. The result is the combined
+feature table, one row per cell.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from rasterio.windows import Window
+
+import h3_cells
+import h3_geometry_cache
+import pixel_labels
+import zonal_stats
+
+# === Layers of the features table and the column each one produces ===
+# stat is "sum" or "mean" of the pixel values, or "landuse" for the GHSL
+# classification counts, shares and majority non-zero class
+FEATURE_LAYERS = [
+    {"path": zonal_stats.GHSL_BUILT_H_2018, "stat": "mean", "column": "avg_building_height_m"},
+    {"path": zonal_stats.GHSL_BUILT_S_2025, "stat": "mean", "column": "mean_built_m2"},
+    {"path": zonal_stats.GHSL_BUILT_C_2018, "stat": "landuse", "categories": zonal_stats.GHSL_BUILT_C_CLASSES},
+    {"path": zonal_stats.VIIRS_AVG_RAD_2021, "stat": "mean", "column": "mean_light"},
+    {"path": zonal_stats.GPW_POPULATION_2020, "stat": "sum", "column": "total_population"},
+]
+
+
+def _tile(window, tile_no, n_tiles):
+    """Row tile tile_no of n_tiles equal tiles of a window"""
+    start = window.row_off + window.height * tile_no // n_tiles
+    stop = window.row_off + window.height * (tile_no + 1) // n_tiles
+    return Window(window.col_off, start, window.width, stop - start)
+
+
+def _tile_task(tile_no, n_tiles, specs):
+    """Worker entry point: reduce tile tile_no of every layer"""
+    results = []
+    for path, band, window, labels_path, n_cells, categories in specs:
+        block = _tile(window, tile_no, n_tiles)
+        results.append(zonal_stats.reduce_block(path, band, window, block, labels_path, n_cells, categories))
+    return results
+
+
+def landuse_columns(stats, categories):
+    """Class pixel counts, class shares and the majority class ignoring class 0, as dense columns"""
+    hist_columns = [f"hist_{value:g}" for value in categories]
+    majority, shares = zonal_stats.class_summary(stats[hist_columns].to_numpy(), categories)
+    out = {name: stats[name].to_numpy() for name in hist_columns}
+    out.update({f"share_{value:g}": shares[:, j] for j, value in enumerate(categories)})
+    out["landuse_class"] = majority
+    return out
+
+
+def extract_features(df, layers=None, workers=None):
+    """Combined feature table of a hex grid: geometry, cell_id and one set of columns per layer"""
+    layers = layers or FEATURE_LAYERS
+    cells = np.unique(h3_cells.to_int_index(df))
+    resolution = int(h3_cells.get_resolution(cells[:1])[0])
+
+    # Windows and pixel labels come first, so the tiled pass only reads and reduces
+    specs, label_sets = [], []
+    for layer in layers:
+        window, labels = zonal_stats.open_layer(layer["path"], cells, resolution, workers=workers)
+        categories = layer.get("categories")
+        categories = None if categories is None else np.sort(np.asarray(categories, dtype=float))
+        specs.append((layer["path"], layer.get("band", 1), window, labels.path, len(labels.cells), categories))
+        label_sets.append(labels)
+
+    n_tiles = max(1, max(-(-spec[2].height // pixel_labels.BLOCK_ROWS) for spec in specs))
+    workers = workers or os.cpu_count() or 1
+    print(f"Extracting {len(layers)} layer(s) over {len(cells)} res-{resolution} cells "
+          f"in {n_tiles} tile(s) on {workers} worker(s)...")
+
+    totals = [
+        (np.zeros(n_cells), np.zeros(n_cells),
+         None if categories is None else np.zeros((n_cells, len(categories))))
+        for _, _, _, _, n_cells, categories in specs
+    ]
+    tile_nos = range(n_tiles)
+    if workers == 1 or n_tiles == 1:
+        results = (_tile_task(i, n_tiles, specs) for i in tile_nos)
+        for tile_results in results:
+            for (counts, sums, hist), partial in zip(totals, tile_results):
+                zonal_stats.accumulate([partial], counts, sums, hist)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for tile_results in pool.map(_tile_task, tile_nos, [n_tiles] * n_tiles, [specs] * n_tiles):
+                for (counts, sums, hist), partial in zip(totals, tile_results):
+                    zonal_stats.accumulate([partial], counts, sums, hist)
+
+    # === One output row per grid cell, in the grid's order ===
+    grid_cells = h3_cells.to_int_index(df)
+    out = pd.DataFrame({
+        "geometry": h3_geometry_cache.wkt(grid_cells),
+        "cell_id": h3_cells.int_to_str(grid_cells),
+    })
+    for layer, spec, labels, (counts, sums, hist) in zip(layers, specs, label_sets, totals):
+        stats = zonal_stats.stats_frame(cells, labels, counts, sums, hist, spec[5]).reindex(grid_cells)
+        if layer["stat"] == "landuse":
+            for name, values in landuse_columns(stats, spec[5]).items():
+                out[name] = values
+        else:
+            out[layer["column"]] = stats[layer["stat"]].to_numpy()
+    return out
@@ -0,0 +1,344 @@
+# -*- coding: utf-8 -*-
+"""Memory-mapped pixel-to-H3 label rasters shared by every zonal layer on a grid.
+
+A label raster gives, for each pixel of a raster window, the position of the
+H3 cell holding the pixel centre in a sorted cell table. It depends only on
+the raster's transform, CRS and window and on the H3 resolution, so layers on
+the same pixel grid (for example the 100 m GHSL built surface, height and
+classification rasters) share one entry. With the labels in hand, each
+statistic is a single np.bincount pass.
+
+get_weights builds the exact variant for fine grids, where a hexagon spans
+only a few pixels and centre assignment quantises the result. Pixels whose
+four corners fall in one cell keep a plain label. Boundary pixels get a
+sparse list of (pixel, cell, fraction) entries from shapely intersections
+of the pixel box with the candidate hexagons. A pixel's fractions always
+sum to 1, so reductions conserve totals.
+
+Each entry lives in LABEL_DIR/<key>/ as:
+
+- cells.npy: sorted uint64 ids of every cell hit by a pixel centre
+- labels.npy: (rows, cols) int32 positions into cells.npy (-1 for the
+  boundary pixels of a coverage entry)
+- pixels.npy, positions.npy, weights.npy: the sparse coverage fractions of
+  boundary pixels, sorted by flat pixel index within the window
+"""
+import hashlib
+import json
+import os
+import shutil
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+import h3.api.basic_int as h3_int
+import numpy as np
+import shapely
+from pyproj import Transformer
+from rasterio.windows import Window
+
+import h3_cells
+import h3_geometry_cache
+
+LABEL_DIR = os.environ.get(
+    "PIXEL_LABEL_DIR", "/home/hid24/dss_data/managed_folders/DISSERTATION/pixel_labels"
+)
+BLOCK_ROWS = 256    # raster rows labelled per worker task
+MAX_RINGS = 8       # neighbour rings searched for hexagons smaller than a pixel
+
+
+def label_key(transform, crs, window, resolution, coverage=False):
+    """sha256 of the pixel grid (transform, CRS, window), the H3 resolution and the entry kind"""
+    spec = {
+        "transform": [round(v, 12) for v in tuple(transform)[:6]],
+        "crs": crs.to_wkt() if crs is not None else None,
+        "window": [int(window.col_off), int(window.row_off), int(window.width), int(window.height)],
+        "resolution": int(resolution),
+    }
+    if coverage:
+        spec["coverage"] = True
+    return hashlib.sha256(json.dumps(spec, sort_keys=True).encode()).hexdigest()
+
+
+def row_blocks(window, block_rows=None):
+    """Split a window into full-width blocks of at most block_rows rows"""
+    block_rows = block_rows or BLOCK_ROWS
+    return [
+        Window(window.col_off, row, window.width, min(block_rows, window.row_off + window.height - row))
+        for row in range(window.row_off, window.row_off + window.height, block_rows)
+    ]
+
+
+def _is_lnglat(crs):
+    return crs is None or crs.to_epsg() == 4326
+
+
+def point_cells(transform, crs, rows, cols, resolution):
+    """H3 cell at each (row, col) pixel coordinate pair, as a uint64 array"""
+    xs, ys = transform * (np.asarray(cols, dtype=float), np.asarray(rows, dtype=float))
+    if not _is_lnglat(crs):
+        xs, ys = Transformer.from_crs(crs, "EPSG:4326", always_xy=True).transform(xs, ys)
+    return h3_cells.latlng_to_cells(ys, xs, resolution)
+
+
+def grid_cells(transform, crs, rows, cols, resolution):
+    """H3 cell at every pixel coordinate of a rows x cols grid, as a (rows, cols) uint64 array"""
+    col_grid, row_grid = np.meshgrid(cols, rows)
+    return point_cells(transform, crs, row_grid.ravel(), col_grid.ravel(), resolution).reshape(len(rows), len(cols))
+
+
+def pixel_cells(transform, crs, window, resolution):
+    """H3 cell of each pixel centre in a window, as a (rows, cols) uint64 array"""
+    rows = np.arange(window.row_off, window.row_off + window.height) + 0.5
+    cols = np.arange(window.col_off, window.col_off + window.width) + 0.5
+    return grid_cells(transform, crs, rows, cols, resolution)
+
+
+def _label_block_task(raw_path, transform, crs, window, block, resolution):
+    """Worker entry point: write one block's uint64 cells, returning its unique cells"""
+    cells = pixel_cells(transform, crs, block, resolution)
+    raw = np.load(raw_path, mmap_mode="r+")
+    raw[block.row_off - window.row_off:block.row_off - window.row_off + block.height] = cells
+    raw.flush()
+    return np.unique(cells)
+
+
+class PixelLabels:
+    """Label raster of one pixel window at one H3 resolution"""
+
+    def __init__(self, path):
+        self.path = path
+        self.cells = np.load(os.path.join(path, "cells.npy"))
+        self.labels = np.load(os.path.join(path, "labels.npy"), mmap_mode="r")
+
+    def block(self, window, block):
+        """Labels of a block of rows inside the window"""
+        start = block.row_off - window.row_off
+        return np.asarray(self.labels[start:start + block.height])
+
+    def positions(self, cells):
+        """Position of each uint64 cell in the cell table, -1 where no pixel centre hit it"""
+        return table_positions(self.cells, cells)
+
+
+def table_positions(table, cells):
+    """Position of each uint64 cell in a sorted cell table, -1 where it is missing"""
+    cells = np.asarray(cells, dtype=np.uint64)
+    if not len(table):
+        return np.full(len(cells), -1)
+    pos = np.minimum(np.searchsorted(table, cells), len(table) - 1)
+    return np.where(table[pos] == cells, pos, -1)
+
+
+def get_labels(transform, crs, window, resolution, workers=None):
+    """Open the label raster for a pixel window, building and storing it on a miss"""
+    key = label_key(transform, crs, window, resolution)
+    path = os.path.join(LABEL_DIR, key)
+    if os.path.exists(os.path.join(path, "labels.npy")):
+        print(f"Reusing res-{resolution} pixel labels {key[:12]} for a {window.width}x{window.height} window")
+        return PixelLabels(path)
+
+    blocks = row_blocks(window)
+    workers = workers or os.cpu_count() or 1
+    print(f"Labelling {window.width}x{window.height} pixels at H3 resolution {resolution} "
+          f"in {len(blocks)} block(s) on {workers} worker(s)...")
+
+    # Build in a temporary directory and move it into place when complete
+    tmp = os.path.join(LABEL_DIR, f".tmp_{uuid.uuid4().hex}")
+    os.makedirs(tmp)
+    raw_path = os.path.join(tmp, "raw.npy")
+    np.lib.format.open_memmap(raw_path, mode="w+", dtype=np.uint64, shape=(window.height, window.width)).flush()
+
+    args = (repeat(raw_path), repeat(transform), repeat(crs), repeat(window), blocks, repeat(resolution))
+    if workers == 1 or len(blocks) <= 1:
+        uniques = list(map(_label_block_task, *args))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            uniques = list(pool.map(_label_block_task, *args))
+
+    cells = np.unique(np.concatenate(uniques)) if uniques else np.zeros(0, dtype=np.uint64)
+    raw = np.load(raw_path, mmap_mode="r")
+    labels = np.lib.format.open_memmap(
+        os.path.join(tmp, "labels.npy"), mode="w+", dtype=np.int32, shape=(window.height, window.width)
+    )
+    for start in range(0, window.height, BLOCK_ROWS):
+        labels[start:start + BLOCK_ROWS] = np.searchsorted(cells, raw[start:start + BLOCK_ROWS])
+    labels.flush()
+    del raw, labels
+    os.remove(raw_path)
+    np.save(os.path.join(tmp, "cells.npy"), cells)
+
+    try:
+        os.replace(tmp, path)
+    except OSError:
+        # Another process stored the same entry first
+        shutil.rmtree(tmp)
+    print(f"  Stored {len(cells)} cells as pixel labels {key[:12]}")
+    return PixelLabels(path)
+
+
+# === Exact pixel coverage fractions ===
+
+def _hex_polygons(cells, crs):
+    """Hexagon polygons of uint64 cells in the raster CRS"""
+    polygons = h3_geometry_cache.polygons(cells)
+    if _is_lnglat(crs):
+        return polygons
+    to_crs = Transformer.from_crs("EPSG:4326", crs, always_xy=True)
+    return shapely.transform(polygons, lambda xy: np.column_stack(to_crs.transform(xy[:, 0], xy[:, 1])))
+
+
+def coverage_fractions(boxes, pixels, cells, crs):
+    """Fraction of each pixel box covered by its paired hexagon"""
+    unique, inverse = np.unique(cells, return_inverse=True)
+    hexes = _hex_polygons(unique, crs)[inverse]
+    return shapely.area(shapely.intersection(boxes[pixels], hexes)) / shapely.area(boxes[pixels])
+
+
+def _weight_block_task(raw_path, transform, crs, window, block, resolution):
+    """Worker entry point: label the interior pixels of one block and weigh its boundary pixels.
+
+    Writes the interior cells (0 for boundary pixels) and returns the
+    boundary entries as flat window pixel index, uint64 cell and fraction.
+    """
+    rows = np.arange(block.row_off, block.row_off + block.height + 1)
+    cols = np.arange(window.col_off, window.col_off + window.width + 1)
+    corners = grid_cells(transform, crs, rows, cols, resolution)
+    corner_cells = np.stack([corners[:-1, :-1], corners[:-1, 1:], corners[1:, :-1], corners[1:, 1:]])
+    # Hexagons are convex, so a pixel with all four corners in one cell lies inside it
+    interior = (corner_cells == corner_cells[0]).all(axis=0)
+
+    raw = np.load(raw_path, mmap_mode="r+")
+    raw[block.row_off - window.row_off:block.row_off - window.row_off + block.height] = np.where(
+        interior, corner_cells[0], 0)
+    raw.flush()
+
+    # === Boundary pixels: intersect the pixel box with candidate hexagons ===
+    b_rows, b_cols = np.nonzero(~interior)
+    centres = point_cells(transform, crs, b_rows + block.row_off + 0.5, b_cols + window.col_off + 0.5, resolution)
+    x0, y0 = transform * (b_cols + window.col_off, b_rows + block.row_off)
+    x1, y1 = transform * (b_cols + window.col_off + 1, b_rows + block.row_off + 1)
+    boxes = shapely.box(np.minimum(x0, x1), np.minimum(y0, y1), np.maximum(x0, x1), np.maximum(y0, y1))
+
+    n = len(b_rows)
+    pixels = np.concatenate([np.tile(np.arange(n), 4), np.arange(n)])
+    cells = np.concatenate([corner_cells[:, b_rows, b_cols].ravel(), centres])
+    pairs = np.unique(np.stack([pixels.astype(np.uint64), cells]), axis=1)
+    pixels, cells = pairs[0].astype(np.int64), pairs[1]
+    fractions = coverage_fractions(boxes, pixels, cells, crs) if n else np.zeros(0)
+
+    # Hexagons smaller than a pixel can sit inside it without holding a corner:
+    # add neighbour rings until every boundary pixel is fully covered
+    for _ in range(MAX_RINGS):
+        covered = np.bincount(pixels, weights=fractions, minlength=n)
+        short = np.flatnonzero(covered < 1 - 1e-6)
+        if not len(short):
+            break
+        in_short = np.isin(pixels, short) & (fractions > 0)
+        ring_cells, inverse = np.unique(cells[in_short], return_inverse=True)
+        rings = [np.array(h3_int.grid_disk(int(c), 1), dtype=np.uint64) for c in ring_cells.tolist()]
+        new_pixels = np.repeat(pixels[in_short], np.array([len(r) for r in rings])[inverse])
+        new_cells = np.concatenate([rings[i] for i in inverse])
+
+        # Keep only the pairs not weighed yet
+        all_pixels, all_cells = np.concatenate([pixels, new_pixels]), np.concatenate([cells, new_cells])
+        _, first = np.unique(np.stack([all_pixels.astype(np.uint64), all_cells]), axis=1, return_index=True)
+        fresh = np.sort(first[first >= len(pixels)])
+        if not len(fresh):
+            break
+        new_pixels, new_cells = all_pixels[fresh], all_cells[fresh]
+        pixels = np.concatenate([pixels, new_pixels])
+        cells = np.concatenate([cells, new_cells])
+        fractions = np.concatenate([fractions, coverage_fractions(boxes, new_pixels, new_cells, crs)])
+
+    # Normalise so each pixel's fractions sum to 1
+    keep = fractions > 1e-9
+    pixels, cells, fractions = pixels[keep], cells[keep], fractions[keep]
+    fractions = fractions / np.bincount(pixels, weights=fractions, minlength=n)[pixels]
+    flat = (b_rows[pixels] + block.row_off - window.row_off) * window.width + b_cols[pixels]
+    order = np.argsort(flat, kind="stable")
+    return flat[order], cells[order], fractions[order]
+
+
+class PixelWeights:
+    """Coverage fractions of one pixel window at one H3 resolution"""
+
+    def __init__(self, path):
+        self.path = path
+        self.cells = np.load(os.path.join(path, "cells.npy"))
+        self.labels = np.load(os.path.join(path, "labels.npy"), mmap_mode="r")
+        self.pixels = np.load(os.path.join(path, "pixels.npy"), mmap_mode="r")
+        self.cell_pos = np.load(os.path.join(path, "positions.npy"), mmap_mode="r")
+        self.weights = np.load(os.path.join(path, "weights.npy"), mmap_mode="r")
+
+    def block(self, window, block):
+        """Interior labels of a block and its boundary entries, with pixel indices flat within the block"""
+        start = block.row_off - window.row_off
+        first, last = np.searchsorted(
+            self.pixels, [start * window.width, (start + block.height) * window.width])
+        return (
+            np.asarray(self.labels[start:start + block.height]),
+            np.asarray(self.pixels[first:last]) - start * window.width,
+            np.asarray(self.cell_pos[first:last]),
+            np.asarray(self.weights[first:last]),
+        )
+
+    def positions(self, cells):
+        """Position of each uint64 cell in the cell table, -1 where no pixel touches it"""
+        return table_positions(self.cells, cells)
+
+
+def get_weights(transform, crs, window, resolution, workers=None):
+    """Open the coverage fractions for a pixel window, building and storing them on a miss"""
+    key = label_key(transform, crs, window, resolution, coverage=True)
+    path = os.path.join(LABEL_DIR, key)
+    if os.path.exists(os.path.join(path, "weights.npy")):
+        print(f"Reusing res-{resolution} coverage weights {key[:12]} for a {window.width}x{window.height} window")
+        return PixelWeights(path)
+
+    blocks = row_blocks(window)
+    workers = workers or os.cpu_count() or 1
+    print(f"Weighing {window.width}x{window.height} pixels against H3 resolution {resolution} "
+          f"in {len(blocks)} block(s) on {workers} worker(s)...")
+
+    tmp = os.path.join(LABEL_DIR, f".tmp_{uuid.uuid4().hex}")
+    os.makedirs(tmp)
+    raw_path = os.path.join(tmp, "raw.npy")
+    np.lib.format.open_memmap(raw_path, mode="w+", dtype=np.uint64, shape=(window.height, window.width)).flush()
+
+    args = (repeat(raw_path), repeat(transform), repeat(crs), repeat(window), blocks, repeat(resolution))
+    if workers == 1 or len(blocks) <= 1:
+        entries = list(map(_weight_block_task, *args))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            entries = list(pool.map(_weight_block_task, *args))
+
+    pixels = np.concatenate([e[0] for e in entries])
+    boundary_cells = np.concatenate([e[1] for e in entries])
+    weights = np.concatenate([e[2] for e in entries]).astype(np.float32)
+
+    # Cell table of interior and boundary cells; 0 marks boundary pixels in the raw raster
+    raw = np.load(raw_path, mmap_mode="r")
+    uniques = [np.unique(raw[start:start + BLOCK_ROWS]) for start in range(0, window.height, BLOCK_ROWS)]
+    cells = np.unique(np.concatenate(uniques + [boundary_cells]))
+    cells = cells[cells != 0]
+    labels = np.lib.format.open_memmap(
+        os.path.join(tmp, "labels.npy"), mode="w+", dtype=np.int32, shape=(window.height, window.width)
+    )
+    for start in range(0, window.height, BLOCK_ROWS):
+        part = raw[start:start + BLOCK_ROWS]
+        labels[start:start + BLOCK_ROWS] = np.where(part == 0, -1, np.searchsorted(cells, part))
+    labels.flush()
+    del raw, labels
+    os.remove(raw_path)
+    np.save(os.path.join(tmp, "cells.npy"), cells)
+    np.save(os.path.join(tmp, "pixels.npy"), pixels)
+    np.save(os.path.join(tmp, "positions.npy"), np.searchsorted(cells, boundary_cells).astype(np.int32))
+    np.save(os.path.join(tmp, "weights.npy"), weights)
+
+    try:
+        os.replace(tmp, path)
+    except OSError:
+        shutil.rmtree(tmp)
+    print(f"  Stored {len(cells)} cells and {len(pixels)} boundary fraction(s) as coverage weights {key[:12]}")
+    return PixelWeights(path)
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""Disk cache of per-cell Earth Engine reduction results.
+
+Several recipes run the same reduction (same asset, date range, band,
+reducer and scale) over grids that share most or all of their cells. Results
+are cached per cell under a key of those parameters, so a rerun or a new
+grid only sends EE the cells that have not been reduced before.
+
+Each key has a directory under CACHE_DIR holding a spec.json describing the
+reduction and append-only seg_<uuid>.json segments mapping cell ids to the
+result properties EE returned.
+"""
+import hashlib
+import json
+import os
+import uuid
+
+CACHE_DIR = os.environ.get(
+    "EE_RESULT_CACHE", "/home/hid24/dss_data/managed_folders/DISSERTATION/ee_result_cache"
+)
+
+
+def reduction_key(asset, reducer, scale, dates=None, band=None, composite=None):
+    """Key of a reduction: asset id, filter dates, band, image composite, reducer and scale"""
+    spec = {
+        "asset": asset,
+        "dates": list(dates) if dates else None,
+        "band": band,
+        "composite": composite,
+        "reducer": reducer,
+        "scale": scale,
+    }
+    digest = hashlib.sha256(json.dumps(spec, sort_keys=True).encode()).hexdigest()
+    return {"key": digest, "spec": spec}
+
+
+def _dir(key):
+    return os.path.join(CACHE_DIR, key["key"])
+
+
+def load(key):
+    """All cached results of a reduction as {cell_id: properties}"""
+    path = _dir(key)
+    results = {}
+    if not os.path.isdir(path):
+        return results
+    for filename in sorted(os.listdir(path)):
+        if filename.startswith("seg_") and filename.endswith(".json"):
+            with open(os.path.join(path, filename)) as f:
+                results.update(json.load(f))
+    return results
+
+
+def store(key, results):
+    """Append {cell_id: properties} results as a new segment"""
+    if not results:
+        return
+    path = _dir(key)
+    os.makedirs(path, exist_ok=True)
+    spec_path = os.path.join(path, "spec.json")
+    if not os.path.exists(spec_path):
+        with open(spec_path, "w") as f:
+            json.dump(key["spec"], f, indent=2)
+    seg = os.path.join(path, f"seg_{uuid.uuid4().hex}.json")
+    with open(seg + ".tmp", "w") as f:
+        json.dump(results, f)
+    os.replace(seg + ".tmp", seg)
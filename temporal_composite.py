@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+"""Streaming temporal composites of monthly rasters.
+
+The light recipes reduce the mean of twelve VIIRS monthly composites, as
+ee.ImageCollection(...).mean() did on Earth Engine. Stacking the months
+locally would take one full raster of memory per month. RunningComposite
+instead folds one month at a time into per-element accumulators for the
+mean, the median, the max and the valid-month count. Up to a year of
+months the median is exact. Past that it is approximated from a histogram,
+so the memory stops growing with the number of months and multi-year panels
+cost one extra read per month.
+
+The accumulators work on any array shape. composite() runs them per pixel
+over row blocks of a raster stack and writes a multi-band GeoTIFF.
+zonal_composite() runs them per cell over the monthly zonal means, reusing
+the same pixel labels for every month.
+"""
+import os
+import warnings
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import numpy as np
+import pandas as pd
+import rasterio
+from rasterio.windows import Window
+
+import h3_cells
+import pixel_labels
+import zonal_stats
+
+VIIRS_MONTHLY_DIR = os.path.join(zonal_stats.RASTER_DIR, "viirs_vcmslcfg_monthly")
+STATS = ("mean", "median", "max", "count")
+BLOCK_PIXELS = 1 << 20     # pixels per composite task, at most about 60 B of accumulators each
+EXACT_STEPS = 12           # up to this many steps the values are kept and the median is exact
+
+# Bin edges of the approximate median past EXACT_STEPS: 0 and log-spaced
+# bins from 0.1 to 1000 nW/cm2/sr, each 1.49 times the previous one,
+# interpolated linearly inside the bin and bounded by the observed min and max
+MEDIAN_EDGES = np.concatenate([[0.0], np.geomspace(0.1, 1000, 24)])
+MEDIAN_BIN_RATIO = float(MEDIAN_EDGES[2] / MEDIAN_EDGES[1])
+
+
+def viirs_monthly(year):
+    """Paths of the monthly avg_rad composites of a year, one per month present"""
+    paths = [os.path.join(VIIRS_MONTHLY_DIR, f"viirs_vcmslcfg_avg_rad_{year}{month:02d}.tif")
+             for month in range(1, 13)]
+    return [path for path in paths if os.path.exists(path)]
+
+
+class RunningComposite:
+    """Per-element mean, approximate median, max and count over time steps.
+
+    add() folds one time step of values with the same shape as the
+    composite, NaN marking missing values. Mean, max and count are exact,
+    from float32 running accumulators.
+
+    With at most EXACT_STEPS steps (max_steps, e.g. the months of a year)
+    the values themselves are kept as float32 and the median is exact, at
+    about 60 B per element. Longer panels read the median off a uint8
+    per-element histogram over fixed edges instead, about 40 B per element
+    however many steps are added. That median falls in the histogram bin of
+    the middle value, so for an odd count it is within a factor of
+    MEDIAN_BIN_RATIO (about 1.5) of the exact one between 0.1 and 1000
+    nW/cm2/sr. For an even count it is within that factor of the interval
+    between the two middle values, which np.nanmedian averages.
+    """
+
+    def __init__(self, shape, edges=MEDIAN_EDGES, max_steps=255):
+        self.edges = np.asarray(edges, dtype=np.float32)
+        self.max_steps = max_steps
+        self.steps = 0
+        counts = np.uint8 if max_steps <= np.iinfo(np.uint8).max else np.uint16
+        self.count = np.zeros(shape, dtype=counts)
+        self.sum = np.zeros(shape, dtype=np.float32)
+        self.min = np.full(shape, np.inf, dtype=np.float32)
+        self.max = np.full(shape, -np.inf, dtype=np.float32)
+        self.values, self.hist = None, None
+        if max_steps <= EXACT_STEPS:
+            self.values = np.full((max_steps,) + tuple(np.atleast_1d(shape)), np.nan, dtype=np.float32)
+        else:
+            self.hist = np.zeros(tuple(np.atleast_1d(shape)) + (len(self.edges) + 1,), dtype=counts)
+
+    def add(self, values):
+        if self.steps == self.max_steps:
+            raise ValueError(f"RunningComposite holds at most {self.max_steps} steps")
+        self.steps += 1
+        values = np.asarray(values, dtype=np.float32)
+        valid = np.isfinite(values)
+        self.count += valid
+        self.sum += np.where(valid, values, np.float32(0))
+        np.fmin(self.min, values, out=self.min)
+        np.fmax(self.max, values, out=self.max)
+        if self.values is not None:
+            self.values[self.steps - 1] = values
+            return
+        # One bin per valid element, so the flat indices never repeat
+        flat = np.flatnonzero(valid)
+        bins = np.searchsorted(self.edges, values.ravel()[flat], side="right")
+        self.hist.reshape(-1, self.hist.shape[-1])[flat, bins] += 1
+
+    def median(self):
+        """Exact median of the kept values, else interpolated inside its histogram bin"""
+        if self.values is not None:
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore", RuntimeWarning)     # all-NaN elements
+                return np.nanmedian(self.values[:max(self.steps, 1)], axis=0)
+        n_bins = self.hist.shape[-1]
+        cum = self.hist.cumsum(axis=-1, dtype=np.uint16)
+        half = self.count / np.float32(2)
+        bin_no = np.minimum((cum < half[..., None]).sum(axis=-1), n_bins - 1)
+        before = np.take_along_axis(cum, bin_no[..., None], axis=-1)[..., 0] - np.take_along_axis(
+            self.hist, bin_no[..., None], axis=-1)[..., 0]
+        in_bin = np.take_along_axis(self.hist, bin_no[..., None], axis=-1)[..., 0]
+
+        bounds = np.concatenate([[-np.inf], self.edges, [np.inf]]).astype(np.float32)
+        lower = np.maximum(bounds[bin_no], self.min)
+        upper = np.minimum(bounds[bin_no + 1], self.max)
+        fraction = (half - before) / np.where(in_bin > 0, in_bin, 1).astype(np.float32)
+        with np.errstate(invalid="ignore"):
+            median = lower + (upper - lower) * np.clip(fraction, 0, 1)
+        return np.where(self.count > 0, median, np.nan)
+
+    def result(self, stats=STATS):
+        """Requested statistics as {name: array}, NaN where no step had a value"""
+        empty = self.count == 0
+        out = {}
+        for stat in stats:
+            if stat == "mean":
+                out[stat] = np.where(empty, np.nan, self.sum / np.where(empty, 1, self.count)).astype(np.float32)
+            elif stat == "median":
+                out[stat] = self.median()
+            elif stat == "max":
+                out[stat] = np.where(empty, np.nan, self.max)
+            elif stat == "count":
+                out[stat] = self.count.astype(np.float32)
+            else:
+                raise ValueError(f"Unknown temporal statistic {stat!r}")
+        return out
+
+
+# === Per-pixel composites of a raster stack ===
+
+def _composite_block(paths, band, block, stats):
+    """Worker entry point: composite one block of rows, reading one month at a time"""
+    acc = RunningComposite((block.height, block.width), max_steps=len(paths))
+    for path in paths:
+        with rasterio.open(path) as src:
+            values = src.read(band, window=block, masked=True)
+        acc.add(np.where(zonal_stats.valid_pixels(values), values.filled(0).astype(np.float32), np.nan))
+    return block, acc.result(stats)
+
+
+def composite(paths, out_path, stats=STATS, band=1, workers=None, block_pixels=None):
+    """Write a per-pixel temporal composite of rasters on one pixel grid.
+
+    The output has one float32 band per statistic, in the order of stats
+    and named after it, with NaN where no month had a valid pixel. Tasks
+    are full-width row blocks of about block_pixels pixels, so their memory
+    does not depend on the raster width.
+    """
+    if not paths:
+        raise ValueError("No rasters to composite")
+    with rasterio.open(paths[0]) as src:
+        profile = src.profile
+    for path in paths[1:]:
+        with rasterio.open(path) as src:
+            if (src.width, src.height, src.transform, src.crs) != (
+                    profile["width"], profile["height"], profile["transform"], profile["crs"]):
+                raise ValueError(f"{path} is not on the pixel grid of {paths[0]}")
+
+    full = Window(0, 0, profile["width"], profile["height"])
+    blocks = pixel_labels.row_blocks(full, max(1, (block_pixels or BLOCK_PIXELS) // profile["width"]))
+    workers = workers or os.cpu_count() or 1
+    print(f"Compositing {len(paths)} raster(s) of {profile['width']}x{profile['height']} pixels "
+          f"into {', '.join(stats)} in {len(blocks)} block(s) on {workers} worker(s)...")
+
+    profile.update(count=len(stats), dtype="float32", nodata=np.nan, compress="deflate",
+                   tiled=True, blockxsize=256, blockysize=256, BIGTIFF="IF_SAFER")
+    tmp = out_path + ".tmp"
+    with rasterio.open(tmp, "w", **profile) as dst:
+        for i, stat in enumerate(stats, start=1):
+            dst.set_band_description(i, stat)
+
+        def write(block, result):
+            for i, stat in enumerate(stats, start=1):
+                dst.write(result[stat].astype(np.float32), i, window=block)
+
+        if workers == 1 or len(blocks) <= 1:
+            for block in blocks:
+                write(*_composite_block(paths, band, block, stats))
+        else:
+            # At most two blocks per worker in flight, so finished blocks do not pile up
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                pending = set()
+                for block in blocks:
+                    pending.add(pool.submit(_composite_block, paths, band, block, stats))
+                    if len(pending) >= 2 * workers:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            write(*future.result())
+                for future in pending:
+                    write(*future.result())
+    os.replace(tmp, out_path)
+    print(f"  Wrote {out_path}")
+    return out_path
+
+
+# === Per-cell composites of monthly zonal means ===
+
+def zonal_composite(paths, cells, stats=STATS, band=1, workers=None):
+    """Temporal composite of the monthly per-cell means of rasters on one pixel grid.
+
+    Each month is one zonal_stats pass over the same cached pixel labels, and
+    only a (cells,) accumulator is kept, so panels of many years stay cheap.
+    Returns a frame indexed by the uint64 cell id with one column per statistic.
+    """
+    cells = np.unique(h3_cells.as_int_ids(cells))
+    acc = RunningComposite(len(cells), max_steps=len(paths))
+    for path in paths:
+        monthly = zonal_stats.zonal_stats(path, cells, band=band, workers=workers)
+        acc.add(monthly["mean"].reindex(cells).to_numpy())
+    return pd.DataFrame(acc.result(stats), index=pd.Index(cells, name="h3_index"))
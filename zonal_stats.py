@@ -0,0 +1,342 @@
+# -*- coding: utf-8 -*-
+"""Local zonal statistics of GeoTIFF rasters over H3 grids.
+
+Replaces Earth Engine reduceRegions for layers that have been downloaded
+to RASTER_DIR. Each pixel is assigned to the H3 cell holding its centre
+through a cached pixel_labels raster, and the raster is reduced per cell
+with np.bincount, so there are no polygon clips and no round trips to a
+remote service. The raster is read in blocks of rows spread over a process
+pool, and the per-block partial sums are added up at the end.
+
+For continental grids, windowed_zonal_stats reads one H3 parent-cell tile
+at a time instead, with a cap on the tiles in flight, so memory stays flat.
+"""
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from itertools import repeat
+
+import h3
+import numpy as np
+import pandas as pd
+import rasterio
+import shapely
+from rasterio.warp import transform_bounds
+from rasterio.windows import Window, from_bounds
+
+import h3_cells
+import h3_geometry_cache
+import pixel_labels
+
+RASTER_DIR = os.environ.get(
+    "ZONAL_RASTER_DIR", "/home/hid24/dss_data/managed_folders/DISSERTATION/rasters"
+)
+TILE_PIXELS = 4000000       # pixels per parent-cell tile in windowed mode
+MAX_TILES = int(os.environ.get("ZONAL_MAX_TILES", 0))   # tiles in flight; 0 means two per worker
+
+# Downloaded copies of the Earth Engine layers used by the zonal recipes
+GPW_POPULATION_2020 = os.path.join(RASTER_DIR, "gpw_v411_population_count_2020.tif")
+# Annual VIIRS composite from compute_viirs_composites: bands mean, median, max, month count
+VIIRS_AVG_RAD_2021 = os.path.join(RASTER_DIR, "viirs_vcmslcfg_avg_rad_2021.tif")
+GHSL_BUILT_S_2025 = os.path.join(RASTER_DIR, "ghs_built_s_2025.tif")
+GHSL_BUILT_H_2018 = os.path.join(RASTER_DIR, "ghs_built_h_2018.tif")
+GHSL_BUILT_C_2018 = os.path.join(RASTER_DIR, "ghs_built_c_2018.tif")
+
+# GHS_BUILT_C classes: 0 no data/unbuilt, 1-5 open spaces, 11-15 residential, 21-25 non-residential
+GHSL_BUILT_C_CLASSES = [0, 1, 2, 3, 4, 5, 11, 12, 13, 14, 15, 21, 22, 23, 24, 25]
+
+
+def grid_bounds(cells):
+    """lng/lat bounding box of a set of uint64 cells"""
+    return tuple(shapely.total_bounds(h3_geometry_cache.polygons(cells)))
+
+
+def pixel_window(window, width, height):
+    """Whole-pixel window covering a fractional one plus a one-pixel margin, clipped to the raster"""
+    col0 = max(int(np.floor(window.col_off)) - 1, 0)
+    row0 = max(int(np.floor(window.row_off)) - 1, 0)
+    col1 = min(int(np.ceil(window.col_off + window.width)) + 1, width)
+    row1 = min(int(np.ceil(window.row_off + window.height)) + 1, height)
+    return Window(col0, row0, max(col1 - col0, 0), max(row1 - row0, 0))
+
+
+def valid_pixels(values):
+    """Boolean mask of the unmasked, finite pixels of a masked read"""
+    return ~np.ma.getmaskarray(values) & np.isfinite(values.filled(np.nan).astype(float))
+
+
+def bincount_stats(labels, values, n_cells, categories=None, weights=None):
+    """Per-label count, sum and optional category histogram of valid pixel values.
+
+    With weights (pixel coverage fractions), counts, sums and histograms are
+    weighted by the fraction of each pixel falling in its cell.
+    """
+    counts = np.bincount(labels, weights=weights, minlength=n_cells)
+    sums = np.bincount(labels, weights=values if weights is None else values * weights, minlength=n_cells)
+    hist = None
+    if categories is not None:
+        cat_pos = np.searchsorted(categories, values)
+        known = (cat_pos < len(categories)) & (categories[np.minimum(cat_pos, len(categories) - 1)] == values)
+        hist = np.bincount(
+            labels[known] * len(categories) + cat_pos[known],
+            weights=None if weights is None else weights[known],
+            minlength=n_cells * len(categories),
+        ).reshape(n_cells, len(categories))
+    return counts, sums, hist
+
+
+def reduce_block(path, band, window, block, labels_path, n_cells, categories, coverage=False):
+    """Per-cell count, sum and optional histogram of one block of rows (a worker entry point)"""
+    with rasterio.open(path) as src:
+        values = src.read(band, window=block, masked=True)
+    valid = valid_pixels(values)
+    if not coverage:
+        labels = pixel_labels.PixelLabels(labels_path).block(window, block)
+        return bincount_stats(labels[valid], values.data[valid].astype(float), n_cells, categories)
+
+    # Interior pixels count fully for their cell, boundary pixels by their coverage fractions
+    labels, pixels, positions, weights = pixel_labels.PixelWeights(labels_path).block(window, block)
+    interior = valid & (labels >= 0)
+    boundary = valid.ravel()[pixels]
+    flat_values = values.data.ravel().astype(float)
+    return bincount_stats(
+        np.concatenate([labels[interior], positions[boundary]]),
+        np.concatenate([values.data[interior].astype(float), flat_values[pixels[boundary]]]),
+        n_cells,
+        categories,
+        weights=np.concatenate([np.ones(interior.sum()), weights[boundary].astype(float)]),
+    )
+
+
+def accumulate(partials, counts, sums, hist):
+    """Add per-block results into the running totals in place"""
+    for block_counts, block_sums, block_hist in partials:
+        counts += block_counts
+        sums += block_sums
+        if hist is not None:
+            hist += block_hist
+
+
+def raster_window(src, cells):
+    """Pixel window of an open raster covering a set of uint64 cells"""
+    bounds = grid_bounds(cells)
+    if src.crs is not None:
+        bounds = transform_bounds("EPSG:4326", src.crs, *bounds)
+    return pixel_window(from_bounds(*bounds, transform=src.transform), src.width, src.height)
+
+
+def open_layer(path, cells, resolution, workers=None, coverage=False):
+    """Pixel window of a raster over the grid and its pixel labels (or coverage weights), built on first use"""
+    get = pixel_labels.get_weights if coverage else pixel_labels.get_labels
+    with rasterio.open(path) as src:
+        window = raster_window(src, cells)
+        labels = get(src.transform, src.crs, window, resolution, workers=workers)
+    return window, labels
+
+
+def stats_frame(cells, labels, counts, sums, hist=None, categories=None, coverage=False):
+    """Per-cell results for the grid cells from totals over the label cell table"""
+    # Cells of the table outside the grid are dropped. Grid cells without pixels
+    # have position -1, which picks the zero row appended to every total.
+    # Coverage-weighted pixel counts are fractional and stay float
+    count_type = float if coverage else np.int64
+    pos = labels.positions(cells)
+    out = pd.DataFrame(index=pd.Index(cells, name="h3_index"))
+    out["count"] = np.append(counts, 0)[pos].astype(count_type)
+    out["sum"] = np.append(sums, 0.0)[pos]
+    out["mean"] = out["sum"] / out["count"].where(out["count"] > 0)
+    if categories is not None:
+        hist = np.vstack([hist, np.zeros((1, len(categories)))])
+        for j, value in enumerate(categories):
+            out[f"hist_{value:g}"] = hist[pos, j].astype(count_type)
+    return out
+
+
+def zonal_stats(path, cells, band=1, categories=None, workers=None, coverage=False):
+    """Reduce a raster over H3 cells.
+
+    Returns a frame indexed by the uint64 cell id with count, sum and mean
+    columns for every requested cell (sum 0 and mean NaN where no valid pixel
+    centre falls in the cell, as with reduceRegions). Passing the category
+    values of a classified raster adds one hist_<value> pixel-count column
+    per category. Pixel-to-cell labels come from pixel_labels, so layers on
+    the same pixel grid label their pixels only once.
+
+    With coverage=True each pixel counts for the exact fraction of its area
+    inside each cell (pixel_labels.get_weights), instead of wholly for the
+    cell holding its centre. Use it for grids whose hexagons span only a few
+    pixels, such as res 7 against 1 km population rasters.
+    """
+    cells = np.unique(h3_cells.as_int_ids(cells))
+    resolution = int(h3_cells.get_resolution(cells[:1])[0])
+    categories = None if categories is None else np.sort(np.asarray(categories, dtype=float))
+
+    window, labels = open_layer(path, cells, resolution, workers=workers, coverage=coverage)
+    n_cells = len(labels.cells)
+    blocks = pixel_labels.row_blocks(window)
+    workers = workers or os.cpu_count() or 1
+    print(f"Reducing {os.path.basename(path)} over {len(cells)} res-{resolution} cells: "
+          f"{window.width}x{window.height} pixels in {len(blocks)} block(s) on {workers} worker(s)...")
+
+    counts, sums = np.zeros(n_cells), np.zeros(n_cells)
+    hist = None if categories is None else np.zeros((n_cells, len(categories)))
+    args = (repeat(path), repeat(band), repeat(window), blocks, repeat(labels.path),
+            repeat(n_cells), repeat(categories), repeat(coverage))
+    if workers == 1 or len(blocks) <= 1:
+        accumulate(map(reduce_block, *args), counts, sums, hist)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            accumulate(pool.map(reduce_block, *args), counts, sums, hist)
+
+    return stats_frame(cells, labels, counts, sums, hist, categories, coverage)
+
+
+# === Categorical rasters ===
+
+def class_summary(hist, categories, ignore=(0,)):
+    """Majority class and class shares of a (cells, classes) pixel-count matrix.
+
+    The majority is the most frequent class outside ignore, <NA> where a
+    cell has none of those pixels. Shares are each class's fraction of the
+    cell's pixels, NaN where the cell has no pixels.
+    """
+    hist = np.asarray(hist, dtype=float)
+    categories = np.asarray(categories)
+    counted = hist * ~np.isin(categories, ignore)
+    majority = pd.array(
+        np.where(counted.sum(axis=1) > 0, categories[counted.argmax(axis=1)], np.nan), dtype="Int64"
+    )
+    totals = hist.sum(axis=1, keepdims=True)
+    shares = hist / np.where(totals > 0, totals, np.nan)
+    return majority, shares
+
+
+def categorical_stats(path, cells, categories, ignore=(0,), band=1, workers=None, coverage=False):
+    """Reduce a classified raster over H3 cells.
+
+    Returns a frame indexed by the uint64 cell id with the pixel count, one
+    hist_<value> pixel-count and share_<value> column per category, and the
+    majority_class from class_summary. The counts come from the 2-D bincount
+    of zonal_stats, so no per-cell histogram dicts are built.
+    """
+    categories = np.sort(np.asarray(categories, dtype=float))
+    stats = zonal_stats(path, cells, band=band, categories=categories, workers=workers, coverage=coverage)
+    hist_columns = [f"hist_{value:g}" for value in categories]
+    majority, shares = class_summary(stats[hist_columns].to_numpy(), categories, ignore)
+
+    out = stats[["count"] + hist_columns].copy()
+    for j, value in enumerate(categories):
+        out[f"share_{value:g}"] = shares[:, j]
+    out["majority_class"] = majority
+    return out
+
+
+# === Windowed mode for continental grids ===
+
+def pixel_area_m2(src):
+    """Approximate ground area of one pixel of an open raster, in square metres"""
+    area = abs(src.transform.a * src.transform.e)
+    if src.crs is not None and src.crs.is_geographic:
+        lat = (src.bounds.top + src.bounds.bottom) / 2
+        area *= 111320.0 ** 2 * np.cos(np.radians(lat))
+    return area
+
+
+def tile_resolution(resolution, pixel_area, tile_pixels=None):
+    """Coarsest parent resolution whose cells hold at most about tile_pixels pixels"""
+    tile_pixels = tile_pixels or TILE_PIXELS
+    for res in range(resolution + 1):
+        if h3.average_hexagon_area(res, unit="m^2") / pixel_area <= tile_pixels:
+            return res
+    return resolution
+
+
+def _parent_tile_task(path, band, tile_cells, resolution, categories):
+    """Worker entry point: reduce the pixels of one parent-cell tile.
+
+    Reads only the window around the tile's cells and keeps the pixels whose
+    centre falls in one of them, so neighbouring tiles never count a pixel twice.
+    """
+    with rasterio.open(path) as src:
+        window = raster_window(src, tile_cells)
+        if not window.width or not window.height:
+            return tile_cells, None
+        values = src.read(band, window=window, masked=True)
+        cells = pixel_labels.pixel_cells(src.transform, src.crs, window, resolution)
+
+    pos = np.minimum(np.searchsorted(tile_cells, cells), len(tile_cells) - 1)
+    keep = (tile_cells[pos] == cells) & valid_pixels(values)
+    return tile_cells, bincount_stats(pos[keep], values.data[keep].astype(float), len(tile_cells), categories)
+
+
+def windowed_zonal_stats(path, cells, band=1, categories=None, workers=None,
+                         max_tiles=None, tile_pixels=None):
+    """zonal_stats for grids too large to label or read in one window.
+
+    The grid is split into tiles of cells sharing an H3 parent, sized so each
+    tile covers about tile_pixels pixels. Tiles are reduced on a process pool
+    and at most max_tiles are in flight at once, so memory stays flat however
+    large the grid is: only the per-cell totals grow with the grid.
+    """
+    cells = np.unique(h3_cells.as_int_ids(cells))
+    resolution = int(h3_cells.get_resolution(cells[:1])[0])
+    categories = None if categories is None else np.sort(np.asarray(categories, dtype=float))
+    workers = workers or os.cpu_count() or 1
+    max_tiles = max_tiles or MAX_TILES or workers * 2
+
+    with rasterio.open(path) as src:
+        parent_res = tile_resolution(resolution, pixel_area_m2(src), tile_pixels)
+    parents = h3_cells.cell_to_parent(cells, parent_res)
+    breaks = np.flatnonzero(np.r_[True, parents[1:] != parents[:-1], True])
+    # Cells are sorted, so cells sharing a parent are contiguous
+    tiles = [cells[start:stop] for start, stop in zip(breaks[:-1], breaks[1:])]
+    print(f"Reducing {os.path.basename(path)} over {len(cells)} res-{resolution} cells in "
+          f"{len(tiles)} res-{parent_res} tile(s), at most {max_tiles} in flight on {workers} worker(s)...")
+
+    counts, sums = np.zeros(len(cells)), np.zeros(len(cells))
+    hist = None if categories is None else np.zeros((len(cells), len(categories)))
+
+    def add(done):
+        for future in done:
+            tile_cells, partial = future.result()
+            if partial is None:
+                continue
+            rows = np.searchsorted(cells, tile_cells)
+            counts[rows] += partial[0]
+            sums[rows] += partial[1]
+            if hist is not None:
+                hist[rows] += partial[2]
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = set()
+        for tile_cells in tiles:
+            pending.add(pool.submit(_parent_tile_task, path, band, tile_cells, resolution, categories))
+            if len(pending) >= max_tiles:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                add(done)
+        add(pending)
+
+    out = pd.DataFrame(index=pd.Index(cells, name="h3_index"))
+    out["count"] = counts.astype(np.int64)
+    out["sum"] = sums
+    out["mean"] = out["sum"] / out["count"].where(out["count"] > 0)
+    if categories is not None:
+        for j, value in enumerate(categories):
+            out[f"hist_{value:g}"] = hist[:, j].astype(np.int64)
+    return out
+
+
+def zonal_frame(df, stats, columns):
+    """DSS output frame shaped like the reduceRegions results.
+
+    df is the hex grid, stats the zonal_stats frame and columns maps a stats
+    column ("sum", "mean", ...) to its output name. Rows keep the grid's order
+    with the hexagon WKT, cell_id and the renamed statistics.
+    """
+    cells = h3_cells.to_int_index(df)
+    out = pd.DataFrame({
+        "geometry": h3_geometry_cache.wkt(cells),
+        "cell_id": h3_cells.int_to_str(cells),
+    })
+    for stat, name in columns.items():
+        out[name] = stats[stat].reindex(cells).to_numpy()
+    return out